@@ -0,0 +1,334 @@
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+import cv2
+
+
+class FrameSource:
+    """帧源基类，接口与cv2.VideoCapture的read/release保持一致"""
+
+    def __init__(self):
+        self.frames_read = 0
+        self.frames_skipped = 0
+
+    @property
+    def fps(self):
+        return 30.0
+
+    def read(self):
+        """返回(ret, frame)"""
+        raise NotImplementedError
+
+    def release(self):
+        pass
+
+    def set_resolution(self, width, height):
+        """调整采集分辨率，不支持的帧源忽略"""
+        return False
+
+    def set_fps(self, fps):
+        """调整采集帧率，不支持的帧源忽略"""
+        return False
+
+    def stats(self):
+        return {
+            "fps": self.fps,
+            "frames_read": self.frames_read,
+            "frames_skipped": self.frames_skipped,
+        }
+
+
+class VideoFileSource(FrameSource):
+    """视频文件
+
+    realtime=True时按视频原始帧率回放，消费者跟不上时跳帧（每次最多max_skip帧）；
+    realtime=False时尽可能快地逐帧读取，用于压力测试。
+    """
+
+    def __init__(self, path, realtime=True, loop=False, max_skip=10):
+        super().__init__()
+        self.cap = cv2.VideoCapture(path)
+        self.path = path
+        self.realtime = realtime
+        self.loop = loop
+        self.max_skip = max_skip
+        self.start_time = None
+        self.position = 0
+
+    @property
+    def fps(self):
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        return fps if fps and fps > 0 else 30.0
+
+    def read(self):
+        if self.realtime:
+            # 按墙上时钟计算应播放到的帧位置
+            now = time.perf_counter()
+            if self.start_time is None:
+                self.start_time = now
+            expected = int((now - self.start_time) * self.fps)
+            skip = min(max(0, expected - self.position), self.max_skip)
+            for _ in range(skip):
+                if not self.cap.grab():
+                    break
+                self.position += 1
+                self.frames_skipped += 1
+            if expected - self.position > self.max_skip:
+                # 落后太多时重新对齐时钟，避免无限追帧
+                self.start_time = now - self.position / self.fps
+
+        ret, frame = self.cap.read()
+        if not ret and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            self.start_time = None
+            self.position = 0
+            ret, frame = self.cap.read()
+        if ret:
+            self.position += 1
+            self.frames_read += 1
+        return ret, frame
+
+    def release(self):
+        self.cap.release()
+
+    def set_resolution(self, width, height):
+        ok_w = self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        ok_h = self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        return ok_w and ok_h
+
+    def set_fps(self, fps):
+        return self.cap.set(cv2.CAP_PROP_FPS, fps)
+
+
+class ImageSequenceSource(FrameSource):
+    """图片序列目录（可以是多个目录），按文件名排序依次读取"""
+
+    IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+    def __init__(self, directory, fps=30.0, realtime=True, loop=True, recursive=False):
+        super().__init__()
+        self.directory = directory
+        directories = [directory] if isinstance(directory, str) else list(directory)
+        self.files = []
+        for path in directories:
+            if recursive:
+                # 按内容哈希分目录存放的历史图片需要递归查找
+                for root, _, names in os.walk(path):
+                    self.files.extend(os.path.join(root, name) for name in names
+                                      if name.lower().endswith(self.IMAGE_EXTENSIONS))
+            elif os.path.isdir(path):
+                self.files.extend(os.path.join(path, name) for name in os.listdir(path)
+                                  if name.lower().endswith(self.IMAGE_EXTENSIONS))
+        self.files.sort()
+        self._fps = fps
+        self.realtime = realtime
+        self.loop = loop
+        self.index = 0
+        self.start_time = None
+
+    @property
+    def fps(self):
+        return self._fps
+
+    def set_fps(self, fps):
+        self._fps = fps
+        self.start_time = None
+        return True
+
+    def read(self):
+        if not self.files:
+            return False, None
+
+        if self.realtime:
+            now = time.perf_counter()
+            if self.start_time is None:
+                self.start_time = now - self.index / self._fps
+            expected = int((now - self.start_time) * self._fps)
+            skip = max(0, expected - self.index)
+            if skip:
+                # 图片序列可随机访问，直接跳到当前应显示的那一帧
+                self.index += skip
+                self.frames_skipped += skip
+
+        if self.index >= len(self.files):
+            if not self.loop:
+                return False, None
+            self.index %= len(self.files)
+            self.start_time = None
+
+        frame = cv2.imread(self.files[self.index])
+        self.index += 1
+        if frame is None:
+            return False, None
+        self.frames_read += 1
+        return True, frame
+
+
+class LatestFrameSource(FrameSource):
+    """后台线程持续读取、只保留最新一帧的帧源
+
+    消费者读取时直接取最新帧，不会阻塞等待设备，
+    中间来不及读取的帧计为跳帧。
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.latest = None
+        self.latest_seq = 0
+        self.consumed_seq = 0
+        self.lock = threading.Lock()
+        self.running = True
+        self.thread = threading.Thread(target=self._reader, daemon=True)
+
+    def _reader(self):
+        raise NotImplementedError
+
+    def _publish(self, frame):
+        with self.lock:
+            self.latest = frame
+            self.latest_seq += 1
+
+    def read(self):
+        with self.lock:
+            if self.latest is None or self.latest_seq == self.consumed_seq:
+                return False, None
+            self.frames_skipped += self.latest_seq - self.consumed_seq - 1
+            self.consumed_seq = self.latest_seq
+            frame = self.latest
+        self.frames_read += 1
+        return True, frame
+
+
+class CameraSource(LatestFrameSource):
+    """本地摄像头
+
+    摄像头的read()会阻塞到下一帧到达，放在后台线程中读取，
+    识别等耗时操作之后界面线程不需要追帧。
+    """
+
+    def __init__(self, index=0, retry_delay=0.5):
+        super().__init__()
+        self.index = index
+        self.retry_delay = retry_delay
+        self.cap = cv2.VideoCapture(index)
+        # 驱动只缓存一帧，读到的总是最近的画面
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self._fps = fps if fps and fps > 0 else 30.0
+        # VideoCapture不是线程安全的，读取和调整参数互斥
+        self.cap_lock = threading.Lock()
+        self.thread.start()
+
+    @property
+    def fps(self):
+        return self._fps
+
+    def _reader(self):
+        while self.running:
+            with self.cap_lock:
+                ret, frame = self.cap.read()
+            if not ret:
+                time.sleep(self.retry_delay)
+                continue
+            self._publish(frame)
+
+    def release(self):
+        self.running = False
+        self.thread.join(timeout=self.retry_delay + 1)
+        # 读取线程可能仍阻塞在cap.read()中，等它退出后再释放
+        with self.cap_lock:
+            self.cap.release()
+
+    def set_resolution(self, width, height):
+        with self.cap_lock:
+            ok_w = self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+            ok_h = self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        return ok_w and ok_h
+
+    def set_fps(self, fps):
+        with self.cap_lock:
+            if not self.cap.set(cv2.CAP_PROP_FPS, fps):
+                return False
+        self._fps = fps
+        return True
+
+
+class NetworkStreamSource(LatestFrameSource):
+    """网络视频流（RTSP/HTTP MJPEG等）
+
+    后台线程持续拉流，只保留最新一帧，断流后自动重连。
+    连接对象只由读取线程创建和释放，release()只通知读取线程退出。
+    """
+
+    def __init__(self, url, reconnect_delay=2.0):
+        super().__init__()
+        self.url = url
+        self.reconnect_delay = reconnect_delay
+        self.cap = None
+        self.cap_lock = threading.Lock()
+        self._fps = 30.0
+        self.thread.start()
+
+    @property
+    def fps(self):
+        return self._fps
+
+    def _reader(self):
+        cap = None
+        try:
+            while self.running:
+                if cap is None:
+                    # 打开网络流可能耗时数十秒，期间可能已被release()
+                    cap = cv2.VideoCapture(self.url)
+                    if not self.running:
+                        break
+                    if not cap.isOpened():
+                        cap.release()
+                        cap = None
+                        time.sleep(self.reconnect_delay)
+                        continue
+                    fps = cap.get(cv2.CAP_PROP_FPS)
+                    if fps and fps > 0:
+                        self._fps = fps
+                    with self.cap_lock:
+                        self.cap = cap
+
+                ret, frame = cap.read()
+                if not ret:
+                    with self.cap_lock:
+                        self.cap = None
+                    cap.release()
+                    cap = None
+                    time.sleep(self.reconnect_delay)
+                    continue
+                self._publish(frame)
+        finally:
+            with self.cap_lock:
+                self.cap = None
+            if cap is not None:
+                cap.release()
+
+    def release(self):
+        # 读取线程退出时自行释放连接，避免在其使用中释放
+        self.running = False
+        self.thread.join(timeout=self.reconnect_delay + 1)
+
+
+def open_frame_source(spec, realtime=True):
+    """根据配置字符串创建帧源
+
+    - 纯数字：本地摄像头编号
+    - 带协议的URL（rtsp://、http://等）：网络视频流
+    - 目录：图片序列
+    - 其他：视频文件
+    """
+    spec = str(spec).strip()
+    if spec.isdigit():
+        return CameraSource(int(spec))
+    if urlparse(spec).scheme in ("rtsp", "rtmp", "http", "https", "udp", "tcp"):
+        return NetworkStreamSource(spec)
+    if os.path.isdir(spec):
+        return ImageSequenceSource(spec, realtime=realtime)
+    return VideoFileSource(spec, realtime=realtime)
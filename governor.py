@@ -0,0 +1,189 @@
+import os
+import time
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+# 采集分辨率档位，从低到高
+RESOLUTION_LEVELS = [(320, 240), (480, 360), (640, 480), (800, 600), (1280, 720)]
+
+
+def parse_resolution(text):
+    """把"640x480"形式的字符串解析为(宽, 高)"""
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+class CpuMonitor:
+    """系统CPU占用率（0~1），优先使用psutil，其次/proc/stat，最后退化为平均负载"""
+
+    def __init__(self):
+        self.last = None
+        if psutil is not None:
+            psutil.cpu_percent(None)
+
+    def read(self):
+        if psutil is not None:
+            return psutil.cpu_percent(None) / 100
+        try:
+            with open("/proc/stat", "r") as f:
+                values = [int(v) for v in f.readline().split()[1:]]
+            idle, total = values[3] + values[4], sum(values)
+            last, self.last = self.last, (idle, total)
+            if last is None or total == last[1]:
+                return 0.0
+            return 1.0 - (idle - last[0]) / (total - last[1])
+        except (OSError, ValueError, IndexError):
+            pass
+        if hasattr(os, "getloadavg"):
+            return min(1.0, os.getloadavg()[0] / (os.cpu_count() or 1))
+        return 0.0
+
+
+class CaptureGovernor:
+    """自适应采集分辨率和帧率的调节器
+
+    根据识别耗时、CPU占用和积压队列深度，在配置的范围内逐级调整：
+    负载过高时依次降低预览刷新率、采集帧率、采集分辨率；
+    负载持续较低时按相反顺序逐级恢复。
+    识别耗时只用上次调节以来新记录的样本：没有新的识别时不作为过载依据，
+    避免一次偶发的慢识别让调节器长期停在最低档。
+    """
+
+    def __init__(self, source, metrics, min_resolution=(320, 240), max_resolution=(640, 480),
+                 min_fps=5, max_fps=30, min_preview_ms=30, max_preview_ms=200,
+                 latency_target_ms=500, cpu_high=0.85, cpu_low=0.5, queue_high=8,
+                 queue_depth=None, relax_ticks=3):
+        self.source = source
+        self.metrics = metrics
+        self.levels = [r for r in RESOLUTION_LEVELS
+                       if min_resolution[0] * min_resolution[1] <= r[0] * r[1]
+                       <= max_resolution[0] * max_resolution[1]] or [max_resolution]
+        self.min_fps = min_fps
+        self.max_fps = max_fps
+        self.min_preview_ms = min_preview_ms
+        self.max_preview_ms = max_preview_ms
+        self.latency_target_ms = latency_target_ms
+        self.cpu_high = cpu_high
+        self.cpu_low = cpu_low
+        self.queue_high = queue_high
+        self.queue_depth = queue_depth
+        self.relax_ticks = relax_ticks
+
+        self.cpu = CpuMonitor()
+        self.level = len(self.levels) - 1
+        self.fps = max_fps
+        self.preview_ms = min_preview_ms
+        self.relaxed_count = 0
+        self.last_skipped = source.frames_skipped
+        self.last_time = time.monotonic()
+        self.latency_count = 0
+        # 最近一次实际设置到帧源的分辨率和帧率，未变化时不重复设置
+        self.applied_resolution = None
+        self.applied_fps = None
+        self.state = {}
+        self.apply()
+
+    @property
+    def resolution(self):
+        return self.levels[self.level]
+
+    def apply(self):
+        """把当前决策应用到帧源并写入指标
+
+        部分摄像头驱动（如V4L2）设置分辨率或帧率会重启视频流，只在值变化时设置。
+        """
+        if self.resolution != self.applied_resolution:
+            self.source.set_resolution(*self.resolution)
+            self.applied_resolution = self.resolution
+        if self.fps != self.applied_fps:
+            self.source.set_fps(self.fps)
+            self.applied_fps = self.fps
+        self.metrics.set_gauge("governor_width", self.resolution[0])
+        self.metrics.set_gauge("governor_height", self.resolution[1])
+        self.metrics.set_gauge("governor_fps", self.fps)
+        self.metrics.set_gauge("governor_preview_ms", self.preview_ms)
+
+    def measure(self):
+        """采集当前负载指标"""
+        now = time.monotonic()
+        skipped = self.source.frames_skipped
+        skip_rate = (skipped - self.last_skipped) / max(now - self.last_time, 1e-3)
+        self.last_skipped, self.last_time = skipped, now
+        queue = self.queue_depth() if self.queue_depth is not None else 0
+        samples, self.latency_count = self.metrics.samples_since("inference_ms", self.latency_count)
+        samples.sort()
+        state = {
+            "cpu": self.cpu.read(),
+            # 没有新样本时为None
+            "latency_ms": samples[min(len(samples) - 1, int(0.9 * len(samples)))] if samples else None,
+            "queue": queue,
+            "skip_rate": skip_rate,
+        }
+        self.metrics.set_gauge("governor_cpu", state["cpu"])
+        self.metrics.set_gauge("governor_queue", queue)
+        self.metrics.set_gauge("governor_skip_rate", skip_rate)
+        return state
+
+    def update(self):
+        """执行一次调节，返回是否有变化"""
+        state = self.state = self.measure()
+        # 跳帧率受预览刷新率影响，只作为指标输出，不参与判断
+        latency = state["latency_ms"]
+        overloaded = (state["cpu"] > self.cpu_high
+                      or (latency is not None and latency > self.latency_target_ms)
+                      or state["queue"] > self.queue_high)
+        relaxed = (state["cpu"] < self.cpu_low
+                   and (latency is None or latency < self.latency_target_ms / 2)
+                   and state["queue"] == 0)
+
+        changed = False
+        if overloaded:
+            self.relaxed_count = 0
+            changed = self.step_down()
+        elif relaxed:
+            self.relaxed_count += 1
+            if self.relaxed_count >= self.relax_ticks:
+                self.relaxed_count = 0
+                changed = self.step_up()
+        else:
+            self.relaxed_count = 0
+
+        if changed:
+            self.apply()
+        return changed
+
+    def step_down(self):
+        if self.preview_ms < self.max_preview_ms:
+            self.preview_ms = min(self.max_preview_ms, self.preview_ms * 2)
+        elif self.fps > self.min_fps:
+            self.fps = max(self.min_fps, self.fps // 2)
+        elif self.level > 0:
+            self.level -= 1
+        else:
+            return False
+        return True
+
+    def step_up(self):
+        if self.level < len(self.levels) - 1:
+            self.level += 1
+        elif self.fps < self.max_fps:
+            self.fps = min(self.max_fps, self.fps * 2)
+        elif self.preview_ms > self.min_preview_ms:
+            self.preview_ms = max(self.min_preview_ms, self.preview_ms // 2)
+        else:
+            return False
+        return True
+
+    def describe(self):
+        """状态栏显示的当前决策"""
+        width, height = self.resolution
+        text = f"采集 {width}x{height} @{self.fps}fps  预览 {self.preview_ms}ms"
+        if self.state:
+            text += f"  CPU {self.state['cpu']:.0%}"
+            if self.state["latency_ms"] is not None:
+                text += f"  识别 {self.state['latency_ms']:.0f}ms"
+        return text
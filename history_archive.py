@@ -0,0 +1,302 @@
+import json
+import os
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from history_index import record_id
+from history_store import history_lock, load_history, save_history, fsync_directory
+
+
+class RetentionPolicy:
+    """历史记录保留策略，值为None或0表示不限制
+
+    - max_age_days: 超过指定天数的记录移入归档
+    - max_records: 工作集最多保留的记录数
+    - max_live_bytes: 工作集图片占用的磁盘上限
+    - archive_max_bytes: 归档总大小上限，超出时删除最早的归档段
+    - low_water: 记录数或图片占用超出上限时，一次整理到上限的这个比例，
+      避免每次整理只移出少量记录而反复重写同一天的归档段
+    """
+
+    def __init__(self, max_age_days=30, max_records=5000,
+                 max_live_bytes=500 * 1024 * 1024, archive_max_bytes=2 * 1024 * 1024 * 1024,
+                 low_water=0.8):
+        self.max_age_days = max_age_days
+        self.max_records = max_records
+        self.max_live_bytes = max_live_bytes
+        self.archive_max_bytes = archive_max_bytes
+        self.low_water = low_water
+
+    @classmethod
+    def from_env(cls):
+        """从环境变量读取保留策略"""
+        def env_int(name, default):
+            value = os.environ.get(name)
+            return int(value) if value else default
+
+        mb = 1024 * 1024
+        return cls(
+            max_age_days=env_int("GARBAGE_RETENTION_DAYS", 30),
+            max_records=env_int("GARBAGE_RETENTION_RECORDS", 5000),
+            max_live_bytes=env_int("GARBAGE_RETENTION_MAX_MB", 500) * mb,
+            archive_max_bytes=env_int("GARBAGE_ARCHIVE_MAX_MB", 2048) * mb,
+        )
+
+
+class IOBudget:
+    """令牌桶限速，限制后台整理任务每秒读写的字节数"""
+
+    def __init__(self, bytes_per_second):
+        self.rate = bytes_per_second
+        self.tokens = bytes_per_second
+        self.last = time.monotonic()
+
+    def consume(self, nbytes):
+        if not self.rate:
+            return
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        self.tokens -= nbytes
+        if self.tokens < 0:
+            time.sleep(-self.tokens / self.rate)
+
+
+class HistoryArchive:
+    """按天划分的只读压缩归档段
+
+    每天一个zip文件，包含records.json和该天记录引用的图片；
+    index.json记录每个归档段的记录数、分类统计和文件大小，
+    查询时只需读取索引，按需打开对应的归档段。
+    """
+
+    def __init__(self, directory="history_archive", cache_size=4):
+        self.directory = directory
+        self.index_file = os.path.join(directory, "index.json")
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def segment_path(self, day):
+        return os.path.join(self.directory, f"{day}.zip")
+
+    def load_index(self):
+        if not os.path.exists(self.index_file):
+            return {}
+        with open(self.index_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_index(self, index):
+        tmp_file = self.index_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, self.index_file)
+
+    def days(self):
+        """已归档的日期列表（升序）"""
+        return sorted(self.load_index())
+
+    def load_segment(self, day):
+        """读取某天的归档记录，最近访问的归档段缓存在内存中"""
+        path = self.segment_path(day)
+        mtime = os.path.getmtime(path)
+        with self.lock:
+            cached = self.cache.get(day)
+            if cached is not None and cached[0] == mtime:
+                self.cache.move_to_end(day)
+                return cached[1]
+        with zipfile.ZipFile(path) as zf:
+            records = json.loads(zf.read("records.json").decode("utf-8"))
+        with self.lock:
+            self.cache[day] = (mtime, records)
+            self.cache.move_to_end(day)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return records
+
+    def read_image(self, day, image_path):
+        """读取归档段中的图片数据，不存在时返回None"""
+        try:
+            with zipfile.ZipFile(self.segment_path(day)) as zf:
+                return zf.read(_image_arcname(image_path))
+        except (KeyError, OSError):
+            return None
+
+    def add_records(self, day, records, budget=None):
+        """把记录及其图片写入某天的归档段，已有归档段时合并后重写
+
+        按记录ID去重，上次整理在归档后、移出工作集前中断时，重复归档不会产生重复记录。
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.segment_path(day)
+        tmp_path = path + ".tmp"
+        all_records = []
+        with zipfile.ZipFile(tmp_path, "w") as out:
+            if os.path.exists(path):
+                with zipfile.ZipFile(path) as old:
+                    for info in old.infolist():
+                        if info.filename == "records.json":
+                            all_records = json.loads(old.read(info).decode("utf-8"))
+                            continue
+                        data = old.read(info)
+                        _consume(budget, len(data) * 2)
+                        out.writestr(info, data)
+
+            names = set(out.namelist())
+            for record in records:
+                image_path = record.get("image", "")
+                arcname = _image_arcname(image_path)
+                if not image_path or arcname in names or not os.path.exists(image_path):
+                    continue
+                with open(image_path, "rb") as f:
+                    data = f.read()
+                _consume(budget, len(data) * 2)
+                # 图片本身已压缩，直接存储
+                out.writestr(arcname, data, compress_type=zipfile.ZIP_STORED)
+                names.add(arcname)
+
+            archived = {record_id(r) for r in all_records}
+            all_records.extend(r for r in records if record_id(r) not in archived)
+            all_records.sort(key=lambda r: r["time"])
+            out.writestr("records.json", json.dumps(all_records, ensure_ascii=False),
+                         compress_type=zipfile.ZIP_DEFLATED)
+
+        with open(tmp_path, "rb+") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        fsync_directory(self.directory)
+
+        types = {}
+        for record in all_records:
+            types[record["type"]] = types.get(record["type"], 0) + 1
+        with self.lock:
+            index = self.load_index()
+            index[day] = {"count": len(all_records), "types": types,
+                          "bytes": os.path.getsize(path)}
+            self._save_index(index)
+            self.cache.pop(day, None)
+
+    def enforce_quota(self, max_bytes):
+        """归档总大小超出上限时，从最早的归档段开始删除"""
+        if not max_bytes:
+            return []
+        with self.lock:
+            index = self.load_index()
+            total = sum(entry["bytes"] for entry in index.values())
+            removed = []
+            for day in sorted(index):
+                if total <= max_bytes:
+                    break
+                total -= index.pop(day)["bytes"]
+                try:
+                    os.remove(self.segment_path(day))
+                except OSError:
+                    pass
+                self.cache.pop(day, None)
+                removed.append(day)
+            if removed:
+                self._save_index(index)
+        return removed
+
+
+class HistoryCompactor:
+    """后台整理任务：按保留策略把旧记录移入归档，并限制归档总大小"""
+
+    def __init__(self, archive, policy, history_file="history.json",
+                 interval=600, io_bytes_per_second=2 * 1024 * 1024):
+        self.archive = archive
+        self.policy = policy
+        self.history_file = history_file
+        self.interval = interval
+        self.io_bytes_per_second = io_bytes_per_second
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.compact()
+            except Exception as e:
+                print(f"历史记录整理失败: {str(e)}")
+            self.stop_event.wait(self.interval)
+
+    def select_expired(self, history):
+        """返回需要移出工作集的记录数（记录按时间先后排列）"""
+        policy = self.policy
+        count = 0
+        if policy.max_age_days:
+            # 按整天过期，每天的记录只归档一次
+            cutoff = (datetime.now() - timedelta(days=policy.max_age_days)).strftime("%Y-%m-%d")
+            while count < len(history) and history[count]["time"][:10] < cutoff:
+                count += 1
+        if policy.max_records and len(history) > policy.max_records:
+            count = max(count, len(history) - int(policy.max_records * policy.low_water))
+        if policy.max_live_bytes:
+            sizes = {}
+            for record in history:
+                image = record.get("image", "")
+                if image not in sizes:
+                    sizes[image] = os.path.getsize(image) if image and os.path.exists(image) else 0
+            refs = {}
+            for record in history:
+                refs[record.get("image", "")] = refs.get(record.get("image", ""), 0) + 1
+            total = sum(sizes.values())
+            target = policy.max_live_bytes * policy.low_water if total > policy.max_live_bytes else total
+            i = 0
+            while total > target and i < len(history):
+                image = history[i].get("image", "")
+                refs[image] -= 1
+                if refs[image] == 0:
+                    total -= sizes[image]
+                i += 1
+            count = max(count, i)
+        return count
+
+    def compact(self):
+        """执行一次整理，返回移入归档的记录数"""
+        budget = IOBudget(self.io_bytes_per_second)
+        history = load_history(self.history_file)
+        expired = history[:self.select_expired(history)]
+
+        # 按天写入归档段，写盘过程不持有历史记录锁
+        by_day = OrderedDict()
+        for record in expired:
+            by_day.setdefault(record["time"][:10], []).append(record)
+        for day, records in by_day.items():
+            if self.stop_event.is_set():
+                break
+            self.archive.add_records(day, records, budget)
+
+            # 从工作集中移除已归档的记录，并删除不再被引用的图片
+            with history_lock:
+                archived = {record_id(r) for r in records}
+                live = [r for r in load_history(self.history_file) if record_id(r) not in archived]
+                save_history(live, self.history_file)
+                referenced = {r.get("image") for r in live}
+                for image in {r.get("image") for r in records} - referenced:
+                    if image and os.path.exists(image):
+                        os.remove(image)
+
+        self.archive.enforce_quota(self.policy.archive_max_bytes)
+        return len(expired)
+
+
+def _image_arcname(image_path):
+    return "images/" + os.path.basename(image_path)
+
+
+def _consume(budget, nbytes):
+    if budget is not None:
+        budget.consume(nbytes)
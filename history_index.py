@@ -0,0 +1,187 @@
+import bisect
+import hashlib
+import os
+import uuid
+
+from history_store import history_lock, load_history, save_history
+
+
+def new_record_id():
+    """生成新记录的ID"""
+    return uuid.uuid4().hex
+
+
+def record_id(record):
+    """记录的稳定ID，旧记录没有id字段时由内容计算"""
+    if "id" in record:
+        return record["id"]
+    key = f"{record['time']}|{record['type']}|{record.get('image', '')}"
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=8).hexdigest()
+
+
+class _DayBucket:
+    """某一天某个来源（工作集或归档段）的记录，按时间排序"""
+
+    def __init__(self, day, archived, records=None, counts=None):
+        self.day = day
+        self.archived = archived
+        self.records = records
+        self.times = None
+        self.counts = counts
+        if records is not None:
+            self.build()
+
+    def build(self):
+        self.records.sort(key=lambda r: r["time"])
+        self.times = [r["time"] for r in self.records]
+        self.counts = {}
+        for record in self.records:
+            self.counts[record["type"]] = self.counts.get(record["type"], 0) + 1
+
+    def load(self, archive):
+        if self.records is None:
+            self.records = list(archive.load_segment(self.day))
+            self.build()
+        return self.records
+
+    def covered(self, start, end):
+        """该天是否完全落在查询时间范围内"""
+        return (start is None or start <= self.day + " 00:00:00") and \
+               (end is None or end >= self.day + " 23:59:59")
+
+    def total(self, category):
+        if category is None:
+            return sum(self.counts.values())
+        return self.counts.get(category, 0)
+
+    def select(self, archive, start, end, category):
+        records = self.load(archive)
+        lo = 0 if start is None else bisect.bisect_left(self.times, start)
+        hi = len(records) if end is None else bisect.bisect_right(self.times, end)
+        if category is None:
+            return records[lo:hi]
+        return [r for r in records[lo:hi] if r["type"] == category]
+
+
+class HistoryIndex:
+    """工作集和归档的时间/分类索引
+
+    记录按天分桶：工作集的桶常驻内存，归档段的桶只保存索引中的分类统计，
+    查询完全覆盖的某天时直接使用统计值计数和跳过，只有真正需要返回记录的
+    归档段才会被打开。
+    """
+
+    def __init__(self, archive, history_file="history.json"):
+        self.archive = archive
+        self.history_file = history_file
+        self.live_mtime = None
+        self.archive_mtime = None
+        self.live = {}
+        self.archived = {}
+        self.refresh()
+
+    def refresh(self):
+        """文件有变化时重建对应部分的索引"""
+        live_mtime = _mtime(self.history_file)
+        if live_mtime != self.live_mtime:
+            self.live_mtime = live_mtime
+            by_day = {}
+            for record in load_history(self.history_file):
+                by_day.setdefault(record["time"][:10], []).append(record)
+            self.live = {day: _DayBucket(day, False, records) for day, records in by_day.items()}
+
+        archive_mtime = _mtime(self.archive.index_file)
+        if archive_mtime != self.archive_mtime:
+            self.archive_mtime = archive_mtime
+            self.archived = {day: _DayBucket(day, True, counts=dict(entry["types"]))
+                             for day, entry in self.archive.load_index().items()}
+
+    def days(self):
+        return sorted(set(self.live) | set(self.archived))
+
+    def _buckets(self, start, end):
+        """按时间顺序返回范围内的桶，同一天归档记录早于工作集记录"""
+        start_day = start[:10] if start else None
+        end_day = end[:10] if end else None
+        for day in self.days():
+            if (start_day and day < start_day) or (end_day and day > end_day):
+                continue
+            if day in self.archived:
+                yield self.archived[day]
+            if day in self.live:
+                yield self.live[day]
+
+    def count(self, start=None, end=None, category=None):
+        """范围内符合条件的记录数"""
+        total = 0
+        for bucket in self._buckets(start, end):
+            if bucket.covered(start, end):
+                total += bucket.total(category)
+            else:
+                total += len(bucket.select(self.archive, start, end, category))
+        return total
+
+    def query(self, start=None, end=None, category=None, offset=0, limit=50):
+        """分页查询，返回[(记录, 归档日期或None)]"""
+        results = []
+        for bucket in self._buckets(start, end):
+            if len(results) >= limit:
+                break
+            if bucket.covered(start, end):
+                n = bucket.total(category)
+                if offset >= n:
+                    offset -= n
+                    continue
+            records = bucket.select(self.archive, start, end, category)
+            if offset >= len(records):
+                offset -= len(records)
+                continue
+            day = bucket.day if bucket.archived else None
+            for record in records[offset:offset + limit - len(results)]:
+                results.append((record, day))
+            offset = 0
+        return results
+
+    def category_counts(self):
+        """全部记录（含归档）的分类统计"""
+        stats = {}
+        for buckets in (self.live, self.archived):
+            for bucket in buckets.values():
+                for type_, count in bucket.counts.items():
+                    stats[type_] = stats.get(type_, 0) + count
+        return stats
+
+    def delete(self, rid):
+        """按ID删除工作集中的记录，返回被删除的记录，不存在时返回None"""
+        with history_lock:
+            history = load_history(self.history_file)
+            for i, record in enumerate(history):
+                if record_id(record) == rid:
+                    break
+            else:
+                return None
+            del history[i]
+
+            # 删除图片文件（图片按内容去重，仍被其他记录引用时保留）
+            image = record.get("image", "")
+            if image and os.path.exists(image) and all(r.get("image") != image for r in history):
+                os.remove(image)
+            fresh = _mtime(self.history_file) == self.live_mtime
+            save_history(history, self.history_file)
+
+            # 索引与文件一致时增量更新，否则留给下次refresh重建
+            bucket = self.live.get(record["time"][:10])
+            if fresh and bucket is not None:
+                bucket.records = [r for r in bucket.records if record_id(r) != rid]
+                bucket.build()
+                if not bucket.records:
+                    del self.live[bucket.day]
+                self.live_mtime = _mtime(self.history_file)
+        return record
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
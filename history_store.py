@@ -0,0 +1,243 @@
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+
+import cv2
+
+
+# 历史记录文件的读写锁，后台整理任务与界面线程共用
+history_lock = threading.RLock()
+
+
+def load_history(history_file="history.json"):
+    """读取历史记录列表"""
+    with history_lock:
+        if not os.path.exists(history_file):
+            return []
+        with open(history_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+
+def save_history(history, history_file="history.json"):
+    """原子地写入历史记录列表"""
+    with history_lock:
+        tmp_file = history_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(history, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, history_file)
+
+
+class HistoryImageStore:
+    """历史图片存储
+
+    - 按图片内容哈希命名，相同图片只保存一份
+    - 编码格式（JPEG质量或WebP）和最大保存分辨率可配置
+    - 编码和写盘在后台线程完成，按批次统一fsync
+    """
+
+    ENCODE_PARAMS = {
+        "jpg": cv2.IMWRITE_JPEG_QUALITY,
+        "webp": cv2.IMWRITE_WEBP_QUALITY,
+    }
+
+    def __init__(self, directory="history_images", fmt="jpg", quality=85,
+                 max_size=640, batch_size=8, flush_interval=1.0):
+        if fmt not in self.ENCODE_PARAMS:
+            raise ValueError(f"不支持的图片格式: {fmt}")
+        self.directory = directory
+        self.fmt = fmt
+        self.quality = quality
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.queue = queue.Queue()
+        self.pending = set()
+        self.pending_lock = threading.Lock()
+        self.thread = threading.Thread(target=self._writer, daemon=True)
+        self.thread.start()
+
+    def path_for(self, digest):
+        """哈希值对应的相对路径，按前两位分目录避免单目录文件过多"""
+        return f"{self.directory}/{digest[:2]}/{digest}.{self.fmt}"
+
+    def put(self, image):
+        """提交一张BGR图片，立即返回保存路径，实际写盘在后台进行"""
+        digest = hashlib.blake2b(image.tobytes(), digest_size=16)
+        digest.update(str(image.shape).encode())
+        digest = digest.hexdigest()
+        path = self.path_for(digest)
+
+        with self.pending_lock:
+            if path in self.pending or os.path.exists(path):
+                return path
+            self.pending.add(path)
+        self.queue.put((path, image))
+        return path
+
+    def flush(self):
+        """等待已提交的图片全部落盘"""
+        self.queue.join()
+
+    def close(self):
+        self.flush()
+        self.queue.put(None)
+        self.thread.join()
+
+    def _encode(self, image):
+        h, w = image.shape[:2]
+        scale = self.max_size / max(h, w) if self.max_size else 1.0
+        if scale < 1.0:
+            image = cv2.resize(image, (int(w * scale), int(h * scale)),
+                               interpolation=cv2.INTER_AREA)
+        ok, data = cv2.imencode(f".{self.fmt}", image,
+                                [self.ENCODE_PARAMS[self.fmt], self.quality])
+        if not ok:
+            raise IOError("图片编码失败")
+        return data.tobytes()
+
+    def _writer(self):
+        while True:
+            batch = [self.queue.get()]
+            if batch[0] is None:
+                self.queue.task_done()
+                return
+            # 在刷新间隔内尽量攒够一批再统一fsync
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self.queue.put(None)
+                    self.queue.task_done()
+                    break
+                batch.append(item)
+
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                print(f"保存历史图片失败: {str(e)}")
+            finally:
+                with self.pending_lock:
+                    for path, _ in batch:
+                        self.pending.discard(path)
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _write_batch(self, batch):
+        # 每张图片单独处理，一张失败不影响同批次的其他图片
+        written = []
+        for path, image in batch:
+            tmp_path = path + ".tmp"
+            f = None
+            try:
+                data = self._encode(image)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                f = open(tmp_path, "wb")
+                f.write(data)
+                written.append((tmp_path, path, f))
+            except Exception as e:
+                print(f"保存历史图片失败: {path}: {str(e)}")
+                _discard_tmp(tmp_path, f)
+
+        # 先统一fsync文件内容，再原子改名，最后每个目录只fsync一次
+        directories = set()
+        for tmp_path, path, f in written:
+            try:
+                f.flush()
+                os.fsync(f.fileno())
+                f.close()
+                os.replace(tmp_path, path)
+                directories.add(os.path.dirname(path))
+            except Exception as e:
+                print(f"保存历史图片失败: {path}: {str(e)}")
+                _discard_tmp(tmp_path, f)
+        for directory in directories:
+            try:
+                fsync_directory(directory)
+            except OSError as e:
+                print(f"同步历史图片目录失败: {directory}: {str(e)}")
+
+
+def _discard_tmp(tmp_path, f):
+    """关闭并删除写入失败的临时文件"""
+    try:
+        if f is not None:
+            f.close()
+    except OSError:
+        pass
+    try:
+        os.remove(tmp_path)
+    except OSError:
+        pass
+
+
+def fsync_directory(directory):
+    """fsync目录以持久化改名操作（Windows不支持，直接跳过）"""
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def migrate_history_images(store, history_file="history.json"):
+    """把旧的按时间命名的历史图片迁移到内容寻址存储，返回迁移的记录数"""
+    history = load_history(history_file)
+    migrated = 0
+    old_images = {}
+    prefix = store.directory + "/"
+    for record in history:
+        image_path = record.get("image", "")
+        if image_path.startswith(prefix) and os.path.dirname(image_path) != store.directory:
+            continue  # 已经是新的存储格式
+        image = cv2.imread(image_path) if os.path.exists(image_path) else None
+        if image is None:
+            continue
+        record["image"] = store.put(image)
+        old_images[image_path] = record["image"]
+        migrated += 1
+
+    store.flush()
+    save_history(history, history_file)
+
+    # 新文件和记录都写好后再删除旧图片
+    for image_path, new_path in old_images.items():
+        if not os.path.exists(new_path):
+            continue
+        try:
+            os.remove(image_path)
+        except OSError:
+            pass
+    return migrated
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="历史图片存储工具")
+    parser.add_argument("--migrate", action="store_true", help="迁移旧的历史图片")
+    parser.add_argument("--history", default="history.json")
+    parser.add_argument("--directory", default="history_images")
+    parser.add_argument("--format", default="jpg", choices=sorted(HistoryImageStore.ENCODE_PARAMS))
+    parser.add_argument("--quality", type=int, default=85)
+    parser.add_argument("--max-size", type=int, default=640)
+    args = parser.parse_args()
+
+    if args.migrate:
+        store = HistoryImageStore(args.directory, args.format, args.quality, args.max_size)
+        count = migrate_history_images(store, args.history)
+        store.close()
+        print(f"已迁移{count}条历史记录的图片")
+    else:
+        parser.print_help()
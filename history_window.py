@@ -1,52 +1,45 @@
 from PySide6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLabel, 
                               QTableWidget, QTableWidgetItem, QPushButton, QWidget,
-                              QTextEdit, QMessageBox, QProgressDialog)
-from PySide6.QtCore import Qt, QThread, Signal
-from PySide6.QtGui import QPixmap
-import json
+                              QTextEdit, QMessageBox, QProgressDialog, QComboBox,
+                              QDateEdit)
+from PySide6.QtCore import Qt, QThread, Signal, QDate
+from PySide6.QtGui import QPixmap, QTextCursor
 import os
 from datetime import datetime
-from openai import OpenAI
+from report_backend import build_messages, get_report_backend, get_report_cache
+from history_archive import HistoryArchive
+from history_index import HistoryIndex, record_id
+from labels import get_label_registry
+from profiler import profiled
 
 class ReportGeneratorThread(QThread):
     """报告生成线程"""
+    chunk = Signal(str)     # 流式生成的文本片段
     finished = Signal(str)  # 生成完成信号
     error = Signal(str)     # 错误信号
 
-    def __init__(self, stats):
+    def __init__(self, stats, backend=None, cache=None):
         super().__init__()
         self.stats = stats
+        self.backend = backend or get_report_backend()
+        self.cache = cache or get_report_cache()
 
     def run(self):
         try:
-            report_prompt = f"""
-            请根据以下垃圾分类数据生成一份环保报告：
-            其他垃圾：{self.stats['其他垃圾']}次
-            厨余垃圾：{self.stats['厨余垃圾']}次
-            可回收物：{self.stats['可回收物']}次
-            有害垃圾：{self.stats['有害垃圾']}次
-            
-            请包含以下内容：
-            1. 用户的垃圾分类情况分析
-            2. 环保贡献
-            3. 改进建议
-            4. 鼓励性的总结
-            """
-
-            client = OpenAI(
-                api_key="fc2fd56184b9f72241cf2871ff6515524bf1f991",
-                base_url="https://aistudio.baidu.com/llm/lmapi/v3",
-            )
+            # 统计数据不变时直接返回缓存的报告
+            key = self.cache.key(self.backend, self.stats)
+            report = self.cache.get(key)
+            if report is not None:
+                self.finished.emit(report)
+                return
 
-            chat_completion = client.chat.completions.create(
-                messages=[
-                    {'role': 'system', 'content': '你是一个环保专家，负责生成垃圾分类的环保报告。'},
-                    {'role': 'user', 'content': report_prompt}
-                ],
-                model="ernie-3.5-8k",
-            )
+            parts = []
+            for text in self.backend.stream(build_messages(self.stats)):
+                parts.append(text)
+                self.chunk.emit(text)
 
-            report = chat_completion.choices[0].message.content
+            report = "".join(parts)
+            self.cache.put(key, report)
             self.finished.emit(report)
 
         except Exception as e:
@@ -57,6 +50,11 @@ class HistoryWindow(QDialog):
         super().__init__(parent)
         self.setWindowTitle("历史记录")
         self.setGeometry(200, 200, 1000, 600)
+        self.archive = HistoryArchive("history_archive")
+        self.index = HistoryIndex(self.archive)
+        self.labels = get_label_registry()
+        self.page = 0
+        self.page_size = 50
         self.init_ui()
         self.load_history()
 
@@ -67,6 +65,32 @@ class HistoryWindow(QDialog):
         # 左侧布局（历史记录）
         left_widget = QWidget()
         left_layout = QVBoxLayout(left_widget)
+
+        # 筛选条件：日期范围和垃圾类型
+        filter_layout = QHBoxLayout()
+        days = self.index.days()
+        first_day = QDate.fromString(days[0], "yyyy-MM-dd") if days else QDate.currentDate()
+        self.start_date = QDateEdit(first_day)
+        self.start_date.setCalendarPopup(True)
+        self.start_date.setDisplayFormat("yyyy-MM-dd")
+        self.end_date = QDateEdit(QDate.currentDate())
+        self.end_date.setCalendarPopup(True)
+        self.end_date.setDisplayFormat("yyyy-MM-dd")
+        self.category_combo = QComboBox()
+        self.category_combo.addItem("全部类型", None)
+        for category in self.labels.category_names:
+            self.category_combo.addItem(category, category)
+        query_button = QPushButton("查询")
+        query_button.clicked.connect(self.apply_filter)
+        filter_layout.addWidget(QLabel("日期:"))
+        filter_layout.addWidget(self.start_date)
+        filter_layout.addWidget(QLabel("至"))
+        filter_layout.addWidget(self.end_date)
+        filter_layout.addWidget(QLabel("类型:"))
+        filter_layout.addWidget(self.category_combo)
+        filter_layout.addWidget(query_button)
+        filter_layout.addStretch()
+        left_layout.addLayout(filter_layout)
         
         # 创建表格
         self.table = QTableWidget()
@@ -78,6 +102,20 @@ class HistoryWindow(QDialog):
         self.table.setColumnWidth(3, 80)   # 操作列宽
         left_layout.addWidget(self.table)
 
+        # 分页
+        page_layout = QHBoxLayout()
+        self.prev_button = QPushButton("上一页")
+        self.prev_button.clicked.connect(lambda: self.change_page(-1))
+        self.next_button = QPushButton("下一页")
+        self.next_button.clicked.connect(lambda: self.change_page(1))
+        self.page_label = QLabel()
+        page_layout.addStretch()
+        page_layout.addWidget(self.prev_button)
+        page_layout.addWidget(self.page_label)
+        page_layout.addWidget(self.next_button)
+        page_layout.addStretch()
+        left_layout.addLayout(page_layout)
+
         # 统计信息
         stats_widget = QWidget()
         stats_layout = QHBoxLayout(stats_widget)
@@ -142,22 +180,42 @@ class HistoryWindow(QDialog):
         main_layout.addWidget(left_widget, 4)
         main_layout.addWidget(right_widget, 3)
 
+    def filter_range(self):
+        """当前筛选条件对应的(开始时间, 结束时间, 类型)"""
+        start = self.start_date.date().toString("yyyy-MM-dd") + " 00:00:00"
+        end = self.end_date.date().toString("yyyy-MM-dd") + " 23:59:59"
+        return start, end, self.category_combo.currentData()
+
+    def apply_filter(self):
+        """按新的筛选条件从第一页开始显示"""
+        self.page = 0
+        self.load_history()
+
+    def change_page(self, step):
+        self.page += step
+        self.load_history()
+
+    @profiled
     def load_history(self):
-        """加载历史记录"""
-        if os.path.exists("history.json"):
-            with open("history.json", "r", encoding="utf-8") as f:
-                history = json.load(f)
-        else:
-            history = []
+        """加载当前筛选条件下的一页历史记录"""
+        self.index.refresh()
+        start, end, category = self.filter_range()
+        self.total = self.index.count(start, end, category)
+        self.page = min(max(self.page, 0), self.page_count() - 1)
+        history = self.index.query(start, end, category,
+                                   self.page * self.page_size, self.page_size)
+        self.update_page_label()
 
+        self.table.clearContents()
         self.table.setRowCount(len(history))
-        for i, record in enumerate(history):
+        for i, (record, day) in enumerate(history):
             # 设置行高为110（图片高度+边距）
             self.table.setRowHeight(i, 110)
             
             # 时间
             time_item = QTableWidgetItem(record["time"])
             time_item.setTextAlignment(Qt.AlignCenter)
+            time_item.setData(Qt.UserRole, record_id(record))
             self.table.setItem(i, 0, time_item)
             
             # 类型
@@ -166,13 +224,20 @@ class HistoryWindow(QDialog):
             self.table.setItem(i, 1, type_item)
             
             # 图片
-            if os.path.exists(record["image"]):
+            pixmap = None
+            if day is not None:
+                data = self.archive.read_image(day, record["image"])
+                if data is not None:
+                    pixmap = QPixmap()
+                    pixmap.loadFromData(data)
+            elif os.path.exists(record["image"]):
+                pixmap = QPixmap(record["image"])
+            if pixmap is not None:
                 image_container = QWidget()
                 image_layout = QHBoxLayout(image_container)
                 image_layout.setContentsMargins(5, 5, 5, 5)
                 
                 label = QLabel()
-                pixmap = QPixmap(record["image"])
                 scaled_pixmap = pixmap.scaled(100, 100, Qt.KeepAspectRatio, Qt.SmoothTransformation)
                 label.setPixmap(scaled_pixmap)
                 label.setStyleSheet("border: 1px solid #bdc3c7; border-radius: 4px;")
@@ -180,7 +245,9 @@ class HistoryWindow(QDialog):
                 image_layout.addWidget(label, alignment=Qt.AlignCenter)
                 self.table.setCellWidget(i, 2, image_container)
             
-            # 删除按钮
+            # 删除按钮（归档记录只读）
+            if day is not None:
+                continue
             delete_container = QWidget()
             delete_layout = QHBoxLayout(delete_container)
             delete_layout.setContentsMargins(5, 5, 5, 5)
@@ -198,7 +265,7 @@ class HistoryWindow(QDialog):
                     background-color: #c0392b;
                 }
             """)
-            delete_btn.clicked.connect(lambda checked, row=i: self.delete_record(row))
+            delete_btn.clicked.connect(lambda checked, rid=record_id(record): self.delete_record(rid))
             
             delete_layout.addWidget(delete_btn)
             self.table.setCellWidget(i, 3, delete_container)
@@ -208,19 +275,8 @@ class HistoryWindow(QDialog):
     def generate_report(self):
         """生成环保报告"""
         try:
-            # 读取历史记录
-            with open("history.json", "r", encoding="utf-8") as f:
-                history = json.load(f)
-            
             # 统计数据
-            stats = {
-                "其他垃圾": 0,
-                "厨余垃圾": 0,
-                "可回收物": 0,
-                "有害垃圾": 0
-            }
-            for record in history:
-                stats[record["type"]] += 1
+            stats = self.collect_statistics()
 
             # 创建进度对话框
             progress = QProgressDialog("正在生成环保报告...", "取消", 0, 0, self)
@@ -229,9 +285,13 @@ class HistoryWindow(QDialog):
             progress.show()
 
             # 创建报告生成线程
+            self.report_text.clear()
             self.report_thread = ReportGeneratorThread(stats)
+            self.report_thread.chunk.connect(self.on_report_chunk)
             self.report_thread.finished.connect(self.on_report_generated)
             self.report_thread.error.connect(self.on_report_error)
+            # 收到第一段文本后即可关闭等待框
+            self.report_thread.chunk.connect(progress.close)
             self.report_thread.finished.connect(progress.close)
             self.report_thread.error.connect(progress.close)
             
@@ -241,6 +301,13 @@ class HistoryWindow(QDialog):
         except Exception as e:
             QMessageBox.warning(self, "错误", f"准备生成报告失败：{str(e)}")
 
+    def on_report_chunk(self, text):
+        """流式追加报告文本"""
+        cursor = self.report_text.textCursor()
+        cursor.movePosition(QTextCursor.End)
+        cursor.insertText(text)
+        self.report_text.setTextCursor(cursor)
+
     def on_report_generated(self, report):
         """报告生成完成的回调"""
         # 在文本框中显示报告
@@ -257,40 +324,32 @@ class HistoryWindow(QDialog):
         """报告生成错误的回调"""
         QMessageBox.warning(self, "错误", f"生成报告失败：{error_msg}")
 
-    def delete_record(self, row):
-        """删除记录"""
-        with open("history.json", "r", encoding="utf-8") as f:
-            history = json.load(f)
-        
-        # 删除图片文件
-        if os.path.exists(history[row]["image"]):
-            os.remove(history[row]["image"])
-        
-        # 删除记录
-        del history[row]
-        
-        # 保存更新后的历史记录
-        with open("history.json", "w", encoding="utf-8") as f:
-            json.dump(history, f, ensure_ascii=False, indent=2)
-        
-        # 刷新显示
-        self.load_history()
+    def delete_record(self, rid):
+        """按记录ID删除记录，只移除表格中对应的行"""
+        if self.index.delete(rid) is None:
+            return
+        for row in range(self.table.rowCount()):
+            item = self.table.item(row, 0)
+            if item is not None and item.data(Qt.UserRole) == rid:
+                self.table.removeRow(row)
+                break
+        self.total -= 1
+        self.update_page_label()
+        self.update_statistics()
+
+    def page_count(self):
+        return max(1, (self.total + self.page_size - 1) // self.page_size)
+
+    def update_page_label(self):
+        pages = self.page_count()
+        self.page_label.setText(f"第{self.page + 1}/{pages}页  共{self.total}条")
+        self.prev_button.setEnabled(self.page > 0)
+        self.next_button.setEnabled(self.page < pages - 1)
 
     def update_statistics(self):
         """更新统计信息"""
         if os.path.exists("history.json"):
-            with open("history.json", "r", encoding="utf-8") as f:
-                history = json.load(f)
-            
-            stats = {
-                "其他垃圾": 0,
-                "厨余垃圾": 0,
-                "可回收物": 0,
-                "有害垃圾": 0
-            }
-            
-            for record in history:
-                stats[record["type"]] += 1
+            stats = self.collect_statistics()
             
             stats_text = "分类统计：  "
             for type_, count in stats.items():
@@ -304,4 +363,19 @@ class HistoryWindow(QDialog):
                 }
             """)
             self.stats_label.setText(stats_text)
- 
\ No newline at end of file
+
+    def collect_statistics(self):
+        """统计工作集和归档中各类垃圾的次数"""
+        counts = [0] * self.labels.num_categories
+        others = {}
+        self.index.refresh()
+        for type_, count in self.index.category_counts().items():
+            category = self.labels.category_id(type_)
+            if category >= 0:
+                counts[category] += count
+            else:
+                # 旧模型或未知类别的记录单独统计
+                others[type_] = others.get(type_, 0) + count
+        stats = dict(zip(self.labels.category_names, counts))
+        stats.update(others)
+        return stats
@@ -0,0 +1,100 @@
+import os
+
+import numpy as np
+import yaml
+
+
+# 垃圾大类及对应的MQTT消息（与garbage_control.py一致），大类编号即在此列表中的位置
+CATEGORIES = ["其他垃圾", "厨余垃圾", "可回收物", "有害垃圾"]
+MQTT_CODES = ["other", "kitchen", "recyclable", "harmful"]
+
+UNKNOWN_CATEGORY = -1
+UNKNOWN_NAME = "未知"
+
+
+class LabelRegistry:
+    """模型类别编号到大类编号、细类名称和MQTT消息的查找表
+
+    由模型配置的label_list（"大类/细类"）一次性构建，识别和统计时只做整数下标查找。
+    label_list中出现的其他大类追加在固定大类之后，没有对应的MQTT消息。
+    """
+
+    def __init__(self, label_list):
+        self.labels = list(label_list)
+        self.category_names = list(CATEGORIES)
+        self.mqtt_codes = list(MQTT_CODES)
+        self.category_ids = {name: i for i, name in enumerate(self.category_names)}
+        self.fine_labels = []
+        class_category = []
+        for label in self.labels:
+            category, _, fine = label.partition("/")
+            if category not in self.category_ids:
+                self.category_ids[category] = len(self.category_names)
+                self.category_names.append(category)
+                self.mqtt_codes.append(None)
+            class_category.append(self.category_ids[category])
+            self.fine_labels.append(fine or category)
+        # 向量化统计用数组，单次查找用列表（比numpy标量下标快）
+        self.class_category = np.array(class_category, dtype=np.int16)
+        self._class_category = class_category
+
+    @classmethod
+    def from_config(cls, config_file):
+        with open(config_file, "r", encoding="utf-8") as f:
+            config = yaml.safe_load(f)
+        return cls(config["PostProcess"]["Topk"]["label_list"])
+
+    @property
+    def num_categories(self):
+        return len(self.category_names)
+
+    def category_of(self, class_id):
+        """类别编号对应的大类编号，超出范围时返回UNKNOWN_CATEGORY"""
+        if 0 <= class_id < len(self._class_category):
+            return self._class_category[class_id]
+        return UNKNOWN_CATEGORY
+
+    def category_name(self, category):
+        return self.category_names[category] if category >= 0 else UNKNOWN_NAME
+
+    def mqtt_code(self, category):
+        """大类对应的MQTT消息，没有对应消息时返回None"""
+        return self.mqtt_codes[category] if category >= 0 else None
+
+    def category_id(self, name):
+        """大类名称对应的编号，未知名称返回UNKNOWN_CATEGORY"""
+        return self.category_ids.get(name, UNKNOWN_CATEGORY)
+
+    def category_of_code(self, code):
+        """MQTT消息对应的大类编号，未知消息返回UNKNOWN_CATEGORY"""
+        try:
+            return self.mqtt_codes.index(code)
+        except ValueError:
+            return UNKNOWN_CATEGORY
+
+    def fine_label(self, class_id):
+        if 0 <= class_id < len(self.fine_labels):
+            return self.fine_labels[class_id]
+        return UNKNOWN_NAME
+
+
+def load_label_registry(model_dir):
+    """从模型目录中的inference.yml加载类别查找表"""
+    return LabelRegistry.from_config(os.path.join(model_dir, "inference.yml"))
+
+
+_registry = None
+
+
+def get_label_registry():
+    """当前使用的类别查找表，未设置时从程序目录下的inference/加载"""
+    global _registry
+    if _registry is None:
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        _registry = load_label_registry(os.path.join(base_dir, "inference"))
+    return _registry
+
+
+def set_label_registry(registry):
+    global _registry
+    _registry = registry
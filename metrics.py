@@ -0,0 +1,66 @@
+import threading
+from collections import deque
+
+
+class Metrics:
+    """进程内的运行指标：计数器、瞬时值和最近一段时间的耗时样本"""
+
+    def __init__(self, window=512):
+        self.window = window
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.timings = {}
+        self.observations = {}
+
+    def incr(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_gauge(self, name, value):
+        with self.lock:
+            self.gauges[name] = value
+
+    def observe(self, name, value):
+        """记录一个耗时样本（毫秒）"""
+        with self.lock:
+            samples = self.timings.get(name)
+            if samples is None:
+                samples = self.timings[name] = deque(maxlen=self.window)
+            samples.append(value)
+            self.observations[name] = self.observations.get(name, 0) + 1
+
+    def percentile(self, name, q):
+        """最近样本的分位数，没有样本时返回None"""
+        with self.lock:
+            samples = sorted(self.timings.get(name, ()))
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(q / 100 * len(samples)))
+        return samples[index]
+
+    def samples_since(self, name, count):
+        """返回第count次记录之后的新样本（最多保留窗口大小个）和当前累计记录次数"""
+        with self.lock:
+            total = self.observations.get(name, 0)
+            new = min(total - count, len(self.timings.get(name, ())))
+            samples = list(self.timings[name])[-new:] if new > 0 else []
+        return samples, total
+
+    def snapshot(self):
+        """当前所有指标的副本，耗时给出p50/p90/p99"""
+        with self.lock:
+            timings = {name: sorted(samples) for name, samples in self.timings.items()}
+            result = {"counters": dict(self.counters), "gauges": dict(self.gauges)}
+        result["timings"] = {}
+        for name, samples in timings.items():
+            if samples:
+                result["timings"][name] = {
+                    f"p{q}": samples[min(len(samples) - 1, int(q / 100 * len(samples)))]
+                    for q in (50, 90, 99)
+                }
+        return result
+
+
+# 全局指标
+metrics = Metrics()
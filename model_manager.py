@@ -0,0 +1,151 @@
+import glob
+import os
+import threading
+import time
+
+from labels import UNKNOWN_CATEGORY, load_label_registry
+
+
+# 样例图片文件名对应的垃圾大类（MQTT消息），用于验证新模型
+SAMPLE_CATEGORIES = {
+    "FoodWaste": "kitchen",
+    "HazardousWaste": "harmful",
+    "OtherWaste": "other",
+    "RecyclableWaste": "recyclable",
+}
+
+
+class ModelValidationError(Exception):
+    """新模型未通过验证"""
+
+
+class PredictorHolder:
+    """双缓冲的模型持有者
+
+    当前模型持续对外提供识别，新模型在后台线程中加载、预热，
+    并用样例图片验证通过后，在两次识别之间原子地替换当前模型。
+    正在进行的识别继续使用旧模型完成，不会丢失任何一次识别。
+    """
+
+    def __init__(self, model_dir, loader, sample_dir="img", min_accuracy=0.5,
+                 warmup_rounds=2):
+        self.loader = loader
+        self.sample_dir = sample_dir
+        self.min_accuracy = min_accuracy
+        self.warmup_rounds = warmup_rounds
+
+        self.lock = threading.Lock()
+        self.model_dir = model_dir
+        self.model = loader(model_dir)
+        self.labels = load_label_registry(model_dir)
+        self.version = 1
+        self.loaded_signature = self.signature(model_dir)
+        self.seen_signature = self.loaded_signature
+        self.failed_signature = None
+
+        self.loading = False
+        self.messages = []
+
+    def predict(self, input_path, **kwargs):
+        """用当前模型识别，返回(结果列表, 与该模型对应的类别查找表)"""
+        with self.lock:
+            model, labels = self.model, self.labels
+        return list(model.predict(input_path, **kwargs)), labels
+
+    @staticmethod
+    def signature(model_dir):
+        """模型目录中文件的修改时间和大小，用于发现模型更新"""
+        files = []
+        for path in sorted(glob.glob(os.path.join(model_dir, "*"))):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((os.path.basename(path), stat.st_mtime_ns, stat.st_size))
+        return tuple(files)
+
+    def check_for_update(self):
+        """模型文件变化且在两次检查间保持稳定时，触发后台重新加载"""
+        signature = self.signature(self.model_dir)
+        if signature in (self.loaded_signature, self.failed_signature) or self.loading:
+            return False
+        if signature != self.seen_signature:
+            # 文件可能还在复制中，等下次检查确认稳定
+            self.seen_signature = signature
+            return False
+        return self.reload()
+
+    def reload(self, model_dir=None):
+        """在后台加载新模型，返回是否已开始加载"""
+        with self.lock:
+            if self.loading:
+                return False
+            self.loading = True
+        model_dir = model_dir or self.model_dir
+        thread = threading.Thread(target=self._load, args=(model_dir,), daemon=True)
+        thread.start()
+        return True
+
+    def _load(self, model_dir):
+        signature = self.signature(model_dir)
+        try:
+            start = time.perf_counter()
+            model = self.loader(model_dir)
+            labels = load_label_registry(model_dir)
+            accuracy = self.validate(model, labels)
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.model = model
+                self.labels = labels
+                self.model_dir = model_dir
+                self.version += 1
+                self.loaded_signature = signature
+                self.seen_signature = signature
+            self._notify(f"模型已更新（验证准确率{accuracy:.0%}，耗时{elapsed:.1f}秒）")
+        except Exception as e:
+            # 加载失败时继续使用旧模型，记下签名避免反复重试同一份文件
+            self.failed_signature = signature
+            self._notify(f"模型更新失败，继续使用原模型: {str(e)}")
+        finally:
+            self.loading = False
+
+    def validate(self, model, labels):
+        """预热新模型并用样例图片验证，返回样例准确率"""
+        samples = sorted(glob.glob(os.path.join(self.sample_dir, "*.jpg")))
+        if not samples:
+            raise ModelValidationError("没有可用于验证的样例图片")
+
+        correct = total = 0
+        for round_ in range(self.warmup_rounds):
+            for path in samples:
+                results = list(model.predict(path, batch_size=1))
+                if not results:
+                    raise ModelValidationError(f"{os.path.basename(path)}没有识别结果")
+                res = results[0]
+                if not len(res['class_ids']) or len(res['class_ids']) != len(res['scores']):
+                    raise ModelValidationError(f"{os.path.basename(path)}识别结果格式错误")
+                if any(not 0.0 <= score <= 1.0 for score in res['scores']):
+                    raise ModelValidationError(f"{os.path.basename(path)}置信度超出范围")
+
+                # 只用最后一轮统计准确率，前面几轮用于预热
+                code = SAMPLE_CATEGORIES.get(os.path.splitext(os.path.basename(path))[0])
+                expected = labels.category_of_code(code)
+                if round_ == self.warmup_rounds - 1 and expected != UNKNOWN_CATEGORY:
+                    total += 1
+                    correct += labels.category_of(int(res['class_ids'][0])) == expected
+
+        accuracy = correct / total if total else 1.0
+        if accuracy < self.min_accuracy:
+            raise ModelValidationError(f"样例准确率{accuracy:.0%}低于{self.min_accuracy:.0%}")
+        return accuracy
+
+    def _notify(self, message):
+        print(message)
+        with self.lock:
+            self.messages.append(message)
+
+    def pop_messages(self):
+        """取出后台加载产生的状态消息，由界面线程显示"""
+        with self.lock:
+            messages, self.messages = self.messages, []
+        return messages
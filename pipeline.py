@@ -0,0 +1,99 @@
+import time
+from datetime import datetime
+
+import cv2
+
+from history_store import history_lock, load_history, save_history
+from history_index import new_record_id
+from metrics import metrics
+
+
+class Detection:
+    """一次识别的top-1结果"""
+
+    __slots__ = ("class_id", "category", "label", "code", "inference_ms")
+
+    def __init__(self, class_id, category, label, code, inference_ms):
+        self.class_id = class_id
+        self.category = category
+        self.label = label
+        self.code = code
+        self.inference_ms = inference_ms
+
+
+class DetectionPipeline:
+    """识别 → 发布 → 记录的处理流程，不依赖界面
+
+    publish(code)发送MQTT消息，speak(text)播放语音提示，由调用方提供，
+    主程序和压力测试共用同一套流程。
+    """
+
+    def __init__(self, model, image_store, score_log, telemetry, publish, speak=None,
+                 camera_id=0, history_file="history.json",
+                 temp_path="temp_frame.jpg", output_path="output_frame.jpg"):
+        self.model = model
+        self.image_store = image_store
+        self.score_log = score_log
+        self.telemetry = telemetry
+        self.publish = publish
+        self.speak = speak
+        self.camera_id = camera_id
+        self.history_file = history_file
+        self.temp_path = temp_path
+        self.output_path = output_path
+
+    def process(self, frame):
+        """识别一帧并发布、记录结果，返回识别结果列表"""
+        # 保存当前帧为临时文件
+        cv2.imwrite(self.temp_path, frame)
+
+        # 进行预测（结果和类别查找表取自同一个模型，识别期间切换模型不会错配）
+        start = time.perf_counter()
+        result, labels = self.model.predict(self.temp_path, batch_size=1)
+        inference_ms = (time.perf_counter() - start) * 1000
+        metrics.observe("inference_ms", inference_ms)
+        metrics.incr("detections")
+
+        detections = []
+        for res in result:
+            self.score_log.append(res['class_ids'], res['scores'], camera_id=self.camera_id)
+            class_id = int(res['class_ids'][0])
+            category = labels.category_of(class_id)
+            detection = Detection(class_id, category, labels.category_name(category),
+                                  labels.mqtt_code(category), inference_ms)
+            self.telemetry.record_detection(detection.code or detection.label, inference_ms)
+
+            # 在新线程中播放语音提示
+            if self.speak is not None:
+                self.speak(f"这是{detection.label}，请放入{detection.label}桶")
+
+            # 发送MQTT消息
+            if detection.code is not None:
+                self.publish(detection.code)
+
+            # 保存识别结果图像和历史记录
+            res.save_to_img(self.output_path)
+            self.save_to_history(detection.label, self.output_path)
+            detections.append(detection)
+        return detections
+
+    def save_to_history(self, label, image_path):
+        """保存识别记录到历史"""
+        image = cv2.imread(image_path)
+        # 持有锁，避免后台整理任务在记录写入前删除同内容的图片
+        with history_lock:
+            # 保存图片副本（后台按内容哈希去重写盘）
+            history_image = self.image_store.put(image) if image is not None else ""
+
+            # 添加新记录
+            history = load_history(self.history_file)
+            record = {
+                "id": new_record_id(),
+                "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "type": label,
+                "image": history_image
+            }
+            history.append(record)
+
+            # 保存历史记录
+            save_history(history, self.history_file)
@@ -1,11 +1,10 @@
 import sys
-import cv2
 from PySide6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                               QHBoxLayout, QPushButton, QLabel, QMessageBox, 
                               QDialog, QGroupBox, QCheckBox, QSlider, QLineEdit, 
                               QSpinBox, QFormLayout, QDialogButtonBox)
 from PySide6.QtCore import Qt, QTimer, QPropertyAnimation, QEasingCurve, QSize
-from PySide6.QtGui import QImage, QPixmap
+from PySide6.QtGui import QPixmap
 from paddlex import create_model
 import paho.mqtt.client as mqtt
 import numpy as np
@@ -14,9 +13,19 @@ import pyttsx3
 from playsound import playsound
 import os
 import threading
-import json
-from datetime import datetime
-import shutil
+import socket
+from frame_source import open_frame_source
+from preview_widget import PreviewWidget
+from history_store import HistoryImageStore
+from history_archive import HistoryArchive, HistoryCompactor, RetentionPolicy
+from score_log import ScoreLog
+from model_manager import PredictorHolder
+from metrics import metrics
+from governor import CaptureGovernor, parse_resolution
+from profiler import profiled, profiler, start_from_env
+from telemetry import TelemetryPublisher, paho_client_factory
+from labels import set_label_registry
+from pipeline import DetectionPipeline
 
 class HoverButton(QPushButton):
     def __init__(self, text, parent=None, size_factor=1.0):
@@ -71,29 +80,87 @@ class GarbageClassificationApp(QMainWindow):
         self.MQTT_TOPIC = "garbage/category"
         self.mqtt_client = None
 
-        # 垃圾类别映射
-        self.garbage_map = {
-            "其他垃圾": "other",
-            "厨余垃圾": "kitchen",
-            "可回收物": "recyclable",
-            "有害垃圾": "harmful"
-        }
-
-        # 加载模型
-        self.model = create_model(r"F:\myitem2\paddle_test\garbage\inference")
+        # 遥测配置：按周期汇总分类计数、识别耗时和错误数，发布到garbage/telemetry/<设备ID>
+        self.DEVICE_ID = os.environ.get("GARBAGE_DEVICE_ID", socket.gethostname())
+        self.TELEMETRY_INTERVAL = int(os.environ.get("GARBAGE_TELEMETRY_INTERVAL", "60"))
+        self.telemetry = TelemetryPublisher(
+            self.DEVICE_ID, self.telemetry_client_factory(), interval=self.TELEMETRY_INTERVAL)
+        if self.TELEMETRY_INTERVAL > 0:
+            self.telemetry.start()
+
+        # 帧源配置：摄像头编号、视频文件、图片目录或网络流地址
+        self.FRAME_SOURCE = os.environ.get("GARBAGE_FRAME_SOURCE", "0")
+        # 是否按源帧率实时回放，关闭后以最快速度回放录制数据
+        self.FRAME_REALTIME = os.environ.get("GARBAGE_FRAME_REALTIME", "1") != "0"
+
+        # 历史图片存储配置：编码格式(jpg/webp)、编码质量、最大保存边长
+        self.HISTORY_IMAGE_FORMAT = os.environ.get("GARBAGE_HISTORY_IMAGE_FORMAT", "jpg")
+        self.HISTORY_IMAGE_QUALITY = int(os.environ.get("GARBAGE_HISTORY_IMAGE_QUALITY", "85"))
+        self.HISTORY_IMAGE_MAX_SIZE = int(os.environ.get("GARBAGE_HISTORY_IMAGE_MAX_SIZE", "640"))
+        self.image_store = HistoryImageStore(
+            "history_images", self.HISTORY_IMAGE_FORMAT,
+            self.HISTORY_IMAGE_QUALITY, self.HISTORY_IMAGE_MAX_SIZE)
+
+        # 历史记录保留策略：超出的旧记录由后台任务按天移入压缩归档
+        self.history_archive = HistoryArchive("history_archive")
+        self.history_compactor = HistoryCompactor(
+            self.history_archive, RetentionPolicy.from_env(),
+            io_bytes_per_second=int(os.environ.get("GARBAGE_COMPACT_IO_KBPS", "2048")) * 1024)
+        self.history_compactor.start()
+
+        # 每次识别的top-k类别和置信度写入列式日志，用于离线统计分析
+        self.CAMERA_ID = int(os.environ.get("GARBAGE_CAMERA_ID", "0"))
+        self.score_log = ScoreLog("score_log")
+
+        # 加载模型：模型目录可配置，文件更新后在后台加载验证并无缝切换
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        self.MODEL_DIR = os.environ.get("GARBAGE_MODEL_DIR", os.path.join(base_dir, "inference"))
+        self.model = PredictorHolder(self.MODEL_DIR, create_model,
+                                     sample_dir=os.path.join(base_dir, "img"))
+        # 类别编号到大类、MQTT消息的查找表，随模型一起加载和切换
+        set_label_registry(self.model.labels)
+        self.model_watch_timer = QTimer()
+        self.model_watch_timer.timeout.connect(self.check_model_update)
+        self.model_watch_timer.start(5000)
+
+        # 识别 → 发布MQTT → 记录历史的处理流程
+        self.pipeline = DetectionPipeline(
+            self.model, self.image_store, self.score_log, self.telemetry,
+            publish=self.send_mqtt_message, speak=self.play_voice, camera_id=self.CAMERA_ID)
 
         # 初始化UI
         self.init_ui()
         
-        # 初始化摄像头
-        self.cap = cv2.VideoCapture(0)
+        # 初始化帧源
+        self.cap = open_frame_source(self.FRAME_SOURCE, realtime=self.FRAME_REALTIME)
         self.timer = QTimer()
         self.timer.timeout.connect(self.update_frame)
-        self.timer.start(30)  # 30ms刷新一次
+        # 按帧源帧率刷新，非实时回放时尽可能快地读取
+        self.timer.start(int(1000 / self.cap.fps) if self.FRAME_REALTIME else 0)
+
+        # 根据识别耗时、CPU占用和写盘队列动态调整采集分辨率、帧率和预览刷新率
+        self.governor = CaptureGovernor(
+            self.cap, metrics,
+            min_resolution=parse_resolution(os.environ.get("GARBAGE_GOVERNOR_MIN_RESOLUTION", "320x240")),
+            max_resolution=parse_resolution(os.environ.get("GARBAGE_GOVERNOR_MAX_RESOLUTION", "640x480")),
+            min_fps=int(os.environ.get("GARBAGE_GOVERNOR_MIN_FPS", "5")),
+            max_fps=int(os.environ.get("GARBAGE_GOVERNOR_MAX_FPS", "30")),
+            min_preview_ms=max(1, int(1000 / self.cap.fps)),
+            max_preview_ms=int(os.environ.get("GARBAGE_GOVERNOR_MAX_PREVIEW_MS", "200")),
+            queue_depth=self.image_store.queue.qsize)
+        self.governor_label = QLabel()
+        self.statusBar().addPermanentWidget(self.governor_label)
+        self.governor_timer = QTimer()
+        self.governor_timer.timeout.connect(self.update_governor)
+        self.governor_timer.start(2000)
 
         # 存储当前帧
         self.current_frame = None
 
+        # 环境变量GARBAGE_PROFILE=秒数时启动即开启性能分析（无界面运行时使用）
+        start_from_env()
+
+    @profiled
     def play_voice_thread(self, text):
         """在新线程中生成并播放语音"""
         with self.voice_lock:  # 使用锁确保同一时间只有一个语音在播放
@@ -112,6 +179,7 @@ class GarbageClassificationApp(QMainWindow):
                 except:
                     pass
             except Exception as e:
+                self.telemetry.record_error("voice")
                 print(f"语音播放错误: {str(e)}")
 
     def play_voice(self, text):
@@ -131,6 +199,10 @@ class GarbageClassificationApp(QMainWindow):
             QMessageBox.warning(self, "连接错误", f"无法连接到MQTT服务器: {str(e)}")
             return False
 
+    def telemetry_client_factory(self):
+        """遥测使用独立的MQTT连接，在后台连接和重连，不阻塞界面"""
+        return paho_client_factory(self.MQTT_BROKER, self.MQTT_PORT, f"garbage_{self.DEVICE_ID}")
+
     def send_mqtt_message(self, message):
         """发送MQTT消息"""
         try:
@@ -138,6 +210,7 @@ class GarbageClassificationApp(QMainWindow):
                 self.mqtt_client.publish(self.MQTT_TOPIC, message)
                 print(f"已发送MQTT消息: {message}")
         except Exception as e:
+            self.telemetry.record_error("mqtt")
             print(f"发送MQTT消息失败: {str(e)}")
         
     def init_ui(self):
@@ -204,9 +277,8 @@ class GarbageClassificationApp(QMainWindow):
             }
         """)
         camera_layout = QVBoxLayout(camera_container)
-        self.camera_label = QLabel()
+        self.camera_label = PreviewWidget()
         self.camera_label.setFixedSize(640, 480)
-        self.camera_label.setStyleSheet("border-radius: 8px;")
         camera_layout.addWidget(self.camera_label)
         left_layout.addWidget(camera_container)
         
@@ -359,56 +431,51 @@ class GarbageClassificationApp(QMainWindow):
         """)
         self.statusBar().showMessage("系统就绪")
 
+    @profiled
     def update_frame(self):
         ret, frame = self.cap.read()
         if ret:
             self.current_frame = frame
-            # 转换图像格式用于显示
-            rgb_image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            h, w, ch = rgb_image.shape
-            bytes_per_line = ch * w
-            qt_image = QImage(rgb_image.data, w, h, bytes_per_line, QImage.Format_RGB888)
-            pixmap = QPixmap.fromImage(qt_image)
-            self.camera_label.setPixmap(pixmap.scaled(self.camera_label.size(), Qt.KeepAspectRatio))
-
+            # 缩放到预分配缓冲区并重绘，无需颜色转换
+            self.camera_label.set_frame(frame)
+
+    def update_governor(self):
+        """执行一次自适应调节，并更新指标和状态栏"""
+        for name, value in self.camera_label.stats().items():
+            metrics.set_gauge(f"preview_{name}", value)
+        for name, value in self.cap.stats().items():
+            metrics.set_gauge(f"source_{name}", value)
+        if self.governor.update() and self.FRAME_REALTIME:
+            self.timer.setInterval(self.governor.preview_ms)
+        self.governor_label.setText(self.governor.describe())
+
+    @profiled
     def detect_garbage(self):
         if self.current_frame is None:
             return
 
         try:
-            # 保存当前帧为临时文件
-            temp_path = "temp_frame.jpg"
-            cv2.imwrite(temp_path, self.current_frame)
-
-            # 进行预测
-            result = self.model.predict(temp_path, batch_size=1)
-
-            for res in result:
-                label = res['label_names'][0].split("/")[0]
-                print(f"检测到垃圾类别: {label}")
-                self.result_label.setText(f"检测到垃圾类别: {label}")
-                
-                # 在新线程中播放语音提示
-                voice_text = f"这是{label}，请放入{label}桶"
-                self.play_voice(voice_text)
-                
-                # 发送MQTT消息
-                if label in self.garbage_map:
-                    message = self.garbage_map[label]
-                    self.send_mqtt_message(message)
+            for detection in self.pipeline.process(self.current_frame):
+                print(f"检测到垃圾类别: {detection.label}")
+                self.result_label.setText(f"检测到垃圾类别: {detection.label}")
 
                 # 显示识别结果图像
-                output_path = "output_frame.jpg"
-                res.save_to_img(output_path)
-                result_pixmap = QPixmap(output_path)
+                result_pixmap = QPixmap(self.pipeline.output_path)
                 self.result_image_label.setPixmap(
                     result_pixmap.scaled(self.result_image_label.size(), Qt.KeepAspectRatio))
-
-                # 保存历史记录
-                self.save_to_history(label, output_path)
         except Exception as e:
+            metrics.incr("detect_errors")
+            self.telemetry.record_error("detect")
             QMessageBox.warning(self, "错误", f"识别过程出错: {str(e)}")
 
+    def check_model_update(self):
+        """检查模型文件更新，并显示后台加载的结果"""
+        if self.model.check_for_update():
+            self.statusBar().showMessage("检测到模型更新，正在后台加载...")
+        for message in self.model.pop_messages():
+            self.statusBar().showMessage(message)
+            set_label_registry(self.model.labels)
+
     def closeEvent(self, event):
         # 程序关闭时释放资源
         self.cap.release()
@@ -417,6 +484,12 @@ class GarbageClassificationApp(QMainWindow):
                 self.mqtt_client.disconnect()
             except:
                 pass
+        # 停止历史整理任务，等待历史图片写盘完成
+        self.history_compactor.stop()
+        self.image_store.close()
+        self.score_log.close()
+        # 发布最后一个周期的遥测数据
+        self.telemetry.stop()
         # 关闭语音引擎
         self.engine.stop()
         event.accept()
@@ -424,39 +497,11 @@ class GarbageClassificationApp(QMainWindow):
     def show_history(self):
         """显示历史记录窗口"""
         from history_window import HistoryWindow
+        # 确保待写入的历史图片已落盘
+        self.image_store.flush()
         history_window = HistoryWindow(self)
         history_window.exec()
 
-    def save_to_history(self, label, image_path):
-        """保存识别记录到历史"""
-        # 创建历史记录目录
-        if not os.path.exists("history_images"):
-            os.makedirs("history_images")
-        
-        # 保存图片副本
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        history_image = f"history_images/image_{timestamp}.jpg"
-        shutil.copy2(image_path, history_image)
-        
-        # 读取现有历史记录
-        if os.path.exists("history.json"):
-            with open("history.json", "r", encoding="utf-8") as f:
-                history = json.load(f)
-        else:
-            history = []
-        
-        # 添加新记录
-        record = {
-            "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "type": label,
-            "image": history_image
-        }
-        history.append(record)
-        
-        # 保存历史记录
-        with open("history.json", "w", encoding="utf-8") as f:
-            json.dump(history, f, ensure_ascii=False, indent=2)
-
     def show_guide(self):
         """显示垃圾分类指南"""
         guide_text = """
@@ -528,7 +573,29 @@ class GarbageClassificationApp(QMainWindow):
         
         mqtt_group.setLayout(mqtt_layout)
         layout.addWidget(mqtt_group)
+
+        # 模型设置
+        model_group = QGroupBox("模型设置")
+        model_layout = QFormLayout()
+        self.model_dir_input = QLineEdit(self.model.model_dir)
+        model_layout.addRow("模型目录:", self.model_dir_input)
+        model_group.setLayout(model_layout)
+        layout.addWidget(model_group)
         
+        # 性能分析设置
+        profile_group = QGroupBox("性能分析")
+        profile_layout = QFormLayout()
+        self.profile_enabled = QCheckBox("开启一次性能分析")
+        self.profile_enabled.setChecked(profiler.active)
+        self.profile_duration = QSpinBox()
+        self.profile_duration.setRange(5, 600)
+        self.profile_duration.setValue(30)
+        self.profile_duration.setSuffix(" 秒")
+        profile_layout.addRow(self.profile_enabled)
+        profile_layout.addRow("分析时长:", self.profile_duration)
+        profile_group.setLayout(profile_layout)
+        layout.addWidget(profile_group)
+
         # 确定和取消按钮
         buttons = QDialogButtonBox(
             QDialogButtonBox.Ok | QDialogButtonBox.Cancel,
@@ -542,10 +609,23 @@ class GarbageClassificationApp(QMainWindow):
             # 保存设置
             self.MQTT_BROKER = self.mqtt_broker_input.text()
             self.MQTT_PORT = self.mqtt_port_input.value()
+            # 模型目录变化时在后台加载新模型
+            model_dir = self.model_dir_input.text().strip()
+            if model_dir and model_dir != self.model.model_dir:
+                if self.model.reload(model_dir):
+                    self.statusBar().showMessage("正在后台加载新模型...")
+            # 开启性能分析窗口，结束后结果保存到profiles目录
+            if self.profile_enabled.isChecked() and not profiler.active:
+                profiler.start(self.profile_duration.value())
+                self.statusBar().showMessage(
+                    f"性能分析已开启，{self.profile_duration.value()}秒后结果保存到{profiler.output_dir}")
+            elif not self.profile_enabled.isChecked() and profiler.active:
+                profiler.stop()
             # 断开现有连接，以便使用新设置重新连接
             if self.mqtt_client:
                 self.mqtt_client.disconnect()
                 self.mqtt_client = None
+            self.telemetry.reconfigure(self.telemetry_client_factory())
 
     def update_voice_rate(self, value):
         """更新语音速率"""
@@ -0,0 +1,81 @@
+import time
+
+import cv2
+import numpy as np
+from PySide6.QtWidgets import QWidget
+from PySide6.QtGui import QImage, QPainter
+
+
+class PreviewWidget(QWidget):
+    """摄像头预览控件
+
+    复用预分配的缓冲区：每帧只用OpenCV缩放一次，直接写入QImage共享的ndarray，
+    QImage使用BGR888格式省去颜色转换，在paintEvent中直接绘制，
+    不再为每帧创建QPixmap。
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.buffer = None
+        self.image = None
+        self.offset = (0, 0)
+        self.source_shape = None
+        self.has_frame = False
+
+        # 每帧耗时统计（毫秒，指数滑动平均）
+        self.resize_ms = 0.0
+        self.paint_ms = 0.0
+        self.frames_painted = 0
+
+    def _allocate(self, frame_shape):
+        """根据帧尺寸和控件尺寸重新分配缓冲区"""
+        src_h, src_w = frame_shape[:2]
+        scale = min(self.width() / src_w, self.height() / src_h)
+        w = max(1, int(src_w * scale))
+        h = max(1, int(src_h * scale))
+        self.buffer = np.zeros((h, w, 3), dtype=np.uint8)
+        self.image = QImage(self.buffer.data, w, h, w * 3, QImage.Format_BGR888)
+        self.offset = ((self.width() - w) // 2, (self.height() - h) // 2)
+        self.source_shape = frame_shape
+
+    def set_frame(self, frame):
+        """更新预览帧（BGR格式）"""
+        start = time.perf_counter()
+        if self.buffer is None or frame.shape != self.source_shape:
+            self._allocate(frame.shape)
+        h, w = self.buffer.shape[:2]
+        if frame.shape[0] == h and frame.shape[1] == w:
+            np.copyto(self.buffer, frame)
+        else:
+            cv2.resize(frame, (w, h), dst=self.buffer, interpolation=cv2.INTER_LINEAR)
+        self.has_frame = True
+        self.resize_ms = self._smooth(self.resize_ms, (time.perf_counter() - start) * 1000)
+        self.update()
+
+    def resizeEvent(self, event):
+        # 控件尺寸变化后，下一帧重新分配缓冲区
+        self.buffer = None
+        self.image = None
+        self.has_frame = False
+        super().resizeEvent(event)
+
+    def paintEvent(self, event):
+        if not self.has_frame:
+            return
+        start = time.perf_counter()
+        painter = QPainter(self)
+        painter.drawImage(self.offset[0], self.offset[1], self.image)
+        painter.end()
+        self.paint_ms = self._smooth(self.paint_ms, (time.perf_counter() - start) * 1000)
+        self.frames_painted += 1
+
+    @staticmethod
+    def _smooth(current, sample, alpha=0.1):
+        return sample if current == 0.0 else current + alpha * (sample - current)
+
+    def stats(self):
+        return {
+            "resize_ms": self.resize_ms,
+            "paint_ms": self.paint_ms,
+            "frames_painted": self.frames_painted,
+        }
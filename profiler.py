@@ -0,0 +1,171 @@
+import cProfile
+import functools
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+
+
+class RuntimeProfiler:
+    """运行时可开关的性能分析
+
+    开启后在固定时长内：
+    - 对标记为@profiled的函数做确定性分析（按线程各自的cProfile），合并输出pstats
+    - 后台线程定时采样主线程和工作线程的调用栈，输出collapsed-stack格式（可生成火焰图）
+    - 用tracemalloc记录内存分配，输出分配最多的代码位置
+    关闭时@profiled只多一次布尔判断，几乎没有额外开销。
+    """
+
+    def __init__(self, output_dir="profiles", sample_interval=0.005, top_allocations=30):
+        self.output_dir = output_dir
+        self.sample_interval = sample_interval
+        self.top_allocations = top_allocations
+        self.active = False
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.profiles = []
+        self.generation = 0
+        self.stacks = Counter()
+        self.stop_event = threading.Event()
+        self.started_tracemalloc = False
+        self.last_output = None
+
+    def start(self, duration=30):
+        """开始一个分析窗口，duration秒后自动停止并输出结果，返回是否已开始"""
+        with self.lock:
+            if self.active:
+                return False
+            self.profiles = []
+            self.stacks = Counter()
+            self.stop_event.clear()
+            self.generation += 1
+            self.active = True
+        self.started_tracemalloc = not tracemalloc.is_tracing()
+        if self.started_tracemalloc:
+            tracemalloc.start(10)
+        threading.Thread(target=self._sampler, args=(duration,), daemon=True).start()
+        print(f"性能分析已开启，{duration}秒后输出到{self.output_dir}")
+        return True
+
+    def _sampler(self, duration):
+        """定时采样所有线程的调用栈，窗口结束后输出结果"""
+        me = threading.get_ident()
+        deadline = time.monotonic() + duration
+        while not self.stop_event.wait(self.sample_interval):
+            if time.monotonic() >= deadline:
+                break
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+        self._finish()
+
+    def stop(self):
+        """提前结束当前分析窗口"""
+        self.stop_event.set()
+
+    def _finish(self):
+        with self.lock:
+            self.active = False
+            profiles = self.profiles
+        snapshot = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+        if self.started_tracemalloc:
+            tracemalloc.stop()
+        try:
+            self.last_output = self._dump(profiles, snapshot)
+            print(f"性能分析结果已保存: {self.last_output}")
+        except Exception as e:
+            print(f"保存性能分析结果失败: {str(e)}")
+
+    def _dump(self, profiles, snapshot):
+        directory = os.path.join(self.output_dir, datetime.now().strftime("%Y%m%d_%H%M%S"))
+        os.makedirs(directory, exist_ok=True)
+
+        # 确定性分析结果合并为一个pstats文件，并附带文本摘要
+        if profiles:
+            stats = pstats.Stats(profiles[0])
+            for profile in profiles[1:]:
+                stats.add(profile)
+            stats.dump_stats(os.path.join(directory, "functions.pstats"))
+            with open(os.path.join(directory, "functions.txt"), "w", encoding="utf-8") as f:
+                pstats.Stats(os.path.join(directory, "functions.pstats"), stream=f) \
+                    .sort_stats("cumulative").print_stats(50)
+
+        # 采样调用栈，collapsed-stack格式
+        with open(os.path.join(directory, "stacks.collapsed"), "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        # 内存分配最多的代码位置
+        if snapshot is not None:
+            snapshot = snapshot.filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__),
+            ])
+            with open(os.path.join(directory, "allocations.txt"), "w", encoding="utf-8") as f:
+                for stat in snapshot.statistics("lineno")[:self.top_allocations]:
+                    f.write(f"{stat}\n")
+                    for line in stat.traceback.format()[-4:]:
+                        f.write(f"    {line}\n")
+        return directory
+
+    def run(self, func, args, kwargs):
+        """在当前线程的cProfile下执行函数"""
+        if getattr(self.local, "depth", 0):
+            # 嵌套调用已在分析中
+            return func(*args, **kwargs)
+        with self.lock:
+            profile = None
+            if self.active:
+                # 每个分析窗口、每个线程使用独立的Profile对象
+                if getattr(self.local, "generation", None) != self.generation:
+                    self.local.generation = self.generation
+                    self.local.profile = cProfile.Profile()
+                    self.profiles.append(self.local.profile)
+                profile = self.local.profile
+        if profile is None:
+            return func(*args, **kwargs)
+        try:
+            profile.enable()
+        except ValueError:
+            # 其他线程的分析器占用中（Python 3.12+），本次只依赖采样
+            return func(*args, **kwargs)
+        self.local.depth = 1
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.disable()
+            self.local.depth = 0
+
+
+# 全局分析器
+profiler = RuntimeProfiler()
+
+
+def profiled(func):
+    """标记需要在分析窗口内做确定性分析的函数"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not profiler.active:
+            return func(*args, **kwargs)
+        return profiler.run(func, args, kwargs)
+    return wrapper
+
+
+def start_from_env():
+    """环境变量GARBAGE_PROFILE设置为秒数时，启动时自动开启一个分析窗口"""
+    duration = os.environ.get("GARBAGE_PROFILE")
+    if duration:
+        return profiler.start(float(duration))
+    return False
@@ -0,0 +1,207 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from openai import OpenAI
+
+
+def build_messages(stats):
+    """根据分类统计构造报告生成的对话消息"""
+    stats_text = "\n".join(f"            {type_}：{count}次" for type_, count in stats.items())
+    report_prompt = f"""
+            请根据以下垃圾分类数据生成一份环保报告：
+{stats_text}
+
+            请包含以下内容：
+            1. 用户的垃圾分类情况分析
+            2. 环保贡献
+            3. 改进建议
+            4. 鼓励性的总结
+            """
+    return [
+        {'role': 'system', 'content': '你是一个环保专家，负责生成垃圾分类的环保报告。'},
+        {'role': 'user', 'content': report_prompt}
+    ]
+
+
+class ReportBackend:
+    """报告生成后端接口，stream()逐段返回生成的文本"""
+
+    name = "base"
+
+    def stream(self, messages):
+        raise NotImplementedError
+
+
+class OpenAIReportBackend(ReportBackend):
+    """OpenAI兼容接口的后端，客户端在多次请求间复用"""
+
+    def __init__(self, api_key, base_url, model="ernie-3.5-8k"):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.model = model
+        self.name = f"{base_url}#{model}"
+        self.client = None
+        self.lock = threading.Lock()
+
+    def get_client(self):
+        with self.lock:
+            if self.client is None:
+                self.client = OpenAI(api_key=self.api_key, base_url=self.base_url)
+            return self.client
+
+    def stream(self, messages):
+        response = self.get_client().chat.completions.create(
+            messages=messages,
+            model=self.model,
+            stream=True,
+        )
+        for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+class ReportCache:
+    """按统计数据哈希缓存已生成的报告，统计不变时直接返回
+
+    内存和磁盘上最多各保留max_entries份，按最近使用淘汰，
+    磁盘上以文件修改时间作为最近使用时间。
+    """
+
+    def __init__(self, directory="report_cache", max_entries=32):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.memory = OrderedDict()
+
+    @staticmethod
+    def key(backend, stats):
+        payload = json.dumps({"backend": backend.name, "stats": stats},
+                             ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        path = os.path.join(self.directory, f"{key}.txt")
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            _touch(path)
+            return self.memory[key]
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                report = f.read()
+            _touch(path)
+            self._remember(key, report)
+            return report
+        return None
+
+    def put(self, key, report):
+        self._remember(key, report)
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = os.path.join(self.directory, f"{key}.txt.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(report)
+        os.replace(tmp_path, os.path.join(self.directory, f"{key}.txt"))
+        self._prune()
+
+    def _remember(self, key, report):
+        self.memory[key] = report
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def _prune(self):
+        """删除最久未使用的缓存文件"""
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".txt"):
+                path = os.path.join(self.directory, name)
+                try:
+                    files.append((os.path.getmtime(path), path))
+                except OSError:
+                    pass
+        files.sort()
+        for _, path in files[:max(0, len(files) - self.max_entries)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _touch(path):
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+_backend = None
+_cache = None
+
+
+def get_report_backend():
+    """进程内共享的报告后端，可通过环境变量指向本地测试服务"""
+    global _backend
+    if _backend is None:
+        _backend = OpenAIReportBackend(
+            api_key=os.environ.get("AI_STUDIO_API_KEY", "fc2fd56184b9f72241cf2871ff6515524bf1f991"),
+            base_url=os.environ.get("GARBAGE_REPORT_BASE_URL", "https://aistudio.baidu.com/llm/lmapi/v3"),
+            model=os.environ.get("GARBAGE_REPORT_MODEL", "ernie-3.5-8k"),
+        )
+    return _backend
+
+
+def set_report_backend(backend):
+    """替换报告后端"""
+    global _backend
+    _backend = backend
+
+
+def get_report_cache():
+    global _cache
+    if _cache is None:
+        _cache = ReportCache(max_entries=int(os.environ.get("GARBAGE_REPORT_CACHE_ENTRIES", "32")))
+    return _cache
+
+
+def serve_stub(port=8000, text="这是一份用于测试的环保报告。"):
+    """启动OpenAI兼容的本地流式测试服务，逐字返回固定文本"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            self.rfile.read(length)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            for char in text:
+                chunk = {
+                    "id": "stub", "object": "chat.completion.chunk", "created": 0,
+                    "model": "stub",
+                    "choices": [{"index": 0, "delta": {"content": char},
+                                 "finish_reason": None}],
+                }
+                self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    print(f"测试服务已启动: http://127.0.0.1:{port}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="环保报告后端工具")
+    parser.add_argument("--stub-server", type=int, metavar="PORT",
+                        help="启动本地流式测试服务")
+    args = parser.parse_args()
+    if args.stub_server:
+        serve_stub(args.stub_server)
+    else:
+        parser.print_help()
@@ -0,0 +1,204 @@
+import os
+import time
+
+import numpy as np
+
+
+class ScoreLog:
+    """每次识别的top-k类别和置信度的列式日志
+
+    数据按段存放，每段是一个目录，每列一个预分配的.npy内存映射文件：
+    - time: 识别时间戳（秒，float64），0表示空行
+    - camera: 摄像头编号（uint16）
+    - class_ids: top-k类别编号（int16，不足k个时填-1）
+    - scores: top-k置信度（float32）
+
+    写入时先写类别和置信度，最后写时间戳，读取方按时间戳非零判断行是否有效，
+    因此查询可以在另一个进程中只读打开，无需解析JSON。
+    时间范围查询依赖时间列单调不减，系统时钟回拨时写入的时间戳不小于上一行。
+    """
+
+    def __init__(self, directory="score_log", topk=5, segment_rows=1 << 20, readonly=False):
+        self.directory = directory
+        self.topk = topk
+        self.segment_rows = segment_rows
+        self.readonly = readonly
+        self.columns = {
+            "time": (np.float64, ()),
+            "camera": (np.uint16, ()),
+            "class_ids": (np.int16, (topk,)),
+            "scores": (np.float32, (topk,)),
+        }
+        self.current = None
+        self.current_name = None
+        self.count = 0
+        self.last_time = 0.0
+        if not readonly:
+            os.makedirs(directory, exist_ok=True)
+            names = self.segment_names()
+            if names:
+                self._open_segment(names[-1])
+            else:
+                self._create_segment(0)
+
+    def segment_names(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name for name in os.listdir(self.directory) if name.isdigit())
+
+    def _load_segment(self, name, mode):
+        path = os.path.join(self.directory, name)
+        return {column: np.load(os.path.join(path, f"{column}.npy"), mmap_mode=mode)
+                for column in self.columns}
+
+    def _create_segment(self, number):
+        name = f"{number:06d}"
+        path = os.path.join(self.directory, name)
+        os.makedirs(path, exist_ok=True)
+        for column, (dtype, shape) in self.columns.items():
+            np.lib.format.open_memmap(os.path.join(path, f"{column}.npy"), mode="w+",
+                                      dtype=dtype, shape=(self.segment_rows,) + shape)
+        self._open_segment(name)
+
+    def _open_segment(self, name):
+        self.current = self._load_segment(name, "r+")
+        self.current_name = name
+        self.count = _valid_rows(self.current["time"])
+        if self.count:
+            self.last_time = float(self.current["time"][self.count - 1])
+
+    def append(self, class_ids, scores, timestamp=None, camera_id=0):
+        """追加一条识别结果"""
+        if self.count >= len(self.current["time"]):
+            self.flush()
+            self._create_segment(int(self.current_name) + 1)
+        i = self.count
+        n = min(len(class_ids), self.topk)
+        row_ids = self.current["class_ids"][i]
+        row_scores = self.current["scores"][i]
+        row_ids[:n] = class_ids[:n]
+        row_ids[n:] = -1
+        row_scores[:n] = scores[:n]
+        row_scores[n:] = 0
+        self.current["camera"][i] = camera_id
+        # NTP校正等导致时钟回拨时沿用上一行的时间，保持时间列有序
+        self.last_time = max(self.last_time, time.time() if timestamp is None else timestamp)
+        self.current["time"][i] = self.last_time
+        self.count += 1
+
+    def flush(self):
+        if self.current is not None:
+            for column in self.current.values():
+                column.flush()
+
+    def close(self):
+        self.flush()
+        self.current = None
+
+    def iter_segments(self, start=None, end=None):
+        """按时间范围逐段返回各列（只读视图，已截去空行）"""
+        for name in self.segment_names():
+            if name == self.current_name and self.current is not None:
+                columns, count = self.current, self.count
+            else:
+                columns = self._load_segment(name, "r")
+                count = _valid_rows(columns["time"])
+            times = columns["time"][:count]
+            if count == 0:
+                continue
+            lo = 0 if start is None else int(np.searchsorted(times, start, "left"))
+            hi = count if end is None else int(np.searchsorted(times, end, "right"))
+            if lo >= hi:
+                continue
+            yield {column: values[lo:hi] for column, values in columns.items()}
+
+    def count_rows(self, start=None, end=None):
+        return sum(len(seg["time"]) for seg in self.iter_segments(start, end))
+
+    def low_confidence_rate(self, threshold=0.5, start=None, end=None):
+        """top-1置信度低于阈值的比例"""
+        low = total = 0
+        for seg in self.iter_segments(start, end):
+            low += int(np.count_nonzero(seg["scores"][:, 0] < threshold))
+            total += len(seg["time"])
+        return low / total if total else 0.0
+
+    def confusion_pairs(self, margin=0.1, limit=10, start=None, end=None):
+        """top-1和top-2置信度差小于margin的易混淆类别对，按次数降序返回[((a, b), 次数)]"""
+        counts = {}
+        for seg in self.iter_segments(start, end):
+            scores = seg["scores"]
+            ids = seg["class_ids"]
+            mask = (scores[:, 0] - scores[:, 1] < margin) & (ids[:, 1] >= 0)
+            top = ids[mask, :2].astype(np.int64)
+            if len(top) == 0:
+                continue
+            a = top.min(axis=1)
+            b = top.max(axis=1)
+            n = int(b.max()) + 1
+            pair_counts = np.bincount(a * n + b, minlength=n * n)
+            for key in np.flatnonzero(pair_counts).tolist():
+                pair = (key // n, key % n)
+                counts[pair] = counts.get(pair, 0) + int(pair_counts[key])
+        return sorted(counts.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+    def hourly_category_mix(self, class_categories, num_categories, start=None, end=None):
+        """按本地时间小时统计top-1所属大类的次数，返回(24, num_categories)数组
+
+        class_categories: 类别编号到大类编号的整数数组
+        """
+        class_categories = np.asarray(class_categories, dtype=np.int64)
+        utc_offset = time.localtime().tm_gmtoff
+        mix = np.zeros(24 * num_categories, dtype=np.int64)
+        for seg in self.iter_segments(start, end):
+            hours = ((seg["time"] + utc_offset) * (1 / 3600)).astype(np.int64) % 24
+            top1 = seg["class_ids"][:, 0]
+            if top1.min() < 0 or top1.max() >= len(class_categories):
+                valid = (top1 >= 0) & (top1 < len(class_categories))
+                hours, top1 = hours[valid], top1[valid]
+            mix += np.bincount(hours * num_categories + class_categories[top1],
+                               minlength=24 * num_categories)
+        return mix.reshape(24, num_categories)
+
+
+def _valid_rows(times):
+    """时间列中有效行数（有效行连续写在前部）"""
+    lo, hi = 0, len(times)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if times[mid] > 0:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+if __name__ == "__main__":
+    import argparse
+    from labels import load_label_registry
+
+    parser = argparse.ArgumentParser(description="识别置信度日志统计")
+    parser.add_argument("--directory", default="score_log")
+    parser.add_argument("--model-dir", default="inference")
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--margin", type=float, default=0.1)
+    args = parser.parse_args()
+
+    log = ScoreLog(args.directory, readonly=True)
+    start_time = time.perf_counter()
+    rows = log.count_rows()
+    low_rate = log.low_confidence_rate(args.threshold)
+    pairs = log.confusion_pairs(args.margin)
+    labels = load_label_registry(args.model_dir)
+    mix = log.hourly_category_mix(labels.class_category, labels.num_categories)
+    elapsed = time.perf_counter() - start_time
+
+    print(f"记录数: {rows}  查询耗时: {elapsed * 1000:.1f}ms")
+    print(f"低置信度(<{args.threshold})比例: {low_rate:.2%}")
+    print("易混淆类别对:")
+    for (a, b), count in pairs:
+        print(f"  {labels.fine_label(a)} / {labels.fine_label(b)}: {count}次")
+    print("各小时分类分布: " + " ".join(labels.category_names))
+    for hour in range(24):
+        if mix[hour].any():
+            print(f"  {hour:02d}时: " + " ".join(str(v) for v in mix[hour]))
@@ -0,0 +1,334 @@
+"""整条处理流程的长时间压力测试
+
+用img/和history_images/中的图片按设定速率回放，完整执行
+采集 → 识别 → 发布MQTT → 记录历史 的流程，MQTT发送到进程内的FakeBroker，
+语音播放替换为空操作，历史记录写入临时目录。定期输出吞吐量、识别耗时、
+内存占用、文件句柄数、线程数和历史数据占用磁盘的变化，结束时给出增长趋势。
+
+用法:
+    python soak_test.py --duration 3600 --capture-fps 15 --detect-rate 2
+    python soak_test.py --synthetic-latency-ms 50   # 不加载真实模型，只测试流程本身
+"""
+import argparse
+import csv
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import cv2
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from frame_source import ImageSequenceSource
+from history_archive import HistoryArchive, HistoryCompactor, RetentionPolicy
+from history_store import HistoryImageStore
+from labels import load_label_registry
+from metrics import metrics
+from model_manager import PredictorHolder
+from pipeline import DetectionPipeline
+from score_log import ScoreLog
+from telemetry import FakeBroker, TelemetryPublisher
+from telemetry_aggregator import TelemetryAggregator
+
+
+class SyntheticResult(dict):
+    """模拟PaddleX识别结果，save_to_img保存输入图片"""
+
+    def __init__(self, image, **kwargs):
+        super().__init__(**kwargs)
+        self.image = image
+
+    def save_to_img(self, path):
+        cv2.imwrite(path, self.image)
+
+
+class SyntheticModel:
+    """按固定耗时返回伪随机top-5结果的模型，用于只测试流程本身的开销"""
+
+    def __init__(self, num_classes, latency_ms):
+        self.num_classes = num_classes
+        self.latency_ms = latency_ms
+        self.calls = 0
+
+    def predict(self, input_path, batch_size=1):
+        image = cv2.imread(input_path)
+        time.sleep(self.latency_ms / 1000)
+        self.calls += 1
+        class_ids = [(self.calls * 7 + i) % self.num_classes for i in range(5)]
+        scores = [0.6, 0.2, 0.1, 0.05, 0.05]
+        yield SyntheticResult(image, class_ids=class_ids, scores=scores,
+                              label_names=[str(i) for i in class_ids])
+
+
+def read_rss_mb():
+    """当前进程常驻内存（MB），优先使用psutil，其次读取/proc/self/status"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def count_fds():
+    """打开的文件句柄数（Windows上为句柄数），无法获取时返回-1"""
+    if psutil is not None:
+        process = psutil.Process()
+        if hasattr(process, "num_fds"):
+            return process.num_fds()
+        return process.num_handles()
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return -1
+
+
+def directory_size_mb(path):
+    """目录实际占用的磁盘空间（MB），预分配的稀疏文件只计已写入部分"""
+    total = 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            try:
+                stat = os.stat(os.path.join(root, name))
+                # Windows没有st_blocks，退化为文件大小
+                blocks = getattr(stat, "st_blocks", None)
+                total += blocks * 512 if blocks is not None else stat.st_size
+            except OSError:
+                pass
+    return total / (1024 * 1024)
+
+
+def percentile(samples, q):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q / 100 * len(samples)))]
+
+
+def slope_per_hour(points):
+    """最小二乘拟合[(秒, 值)]的斜率，换算为每小时变化量"""
+    if len(points) < 2:
+        return 0.0
+    n = len(points)
+    mean_t = sum(t for t, _ in points) / n
+    mean_v = sum(v for _, v in points) / n
+    var = sum((t - mean_t) ** 2 for t, _ in points)
+    if not var:
+        return 0.0
+    cov = sum((t - mean_t) * (v - mean_v) for t, v in points)
+    return cov / var * 3600
+
+
+class SoakTest:
+    def __init__(self, sources, work_dir, model_dir, capture_fps=15.0, detect_rate=2.0,
+                 synthetic_latency_ms=None, telemetry_interval=10):
+        self.work_dir = work_dir
+        self.capture_fps = capture_fps
+        self.detect_rate = detect_rate
+
+        self.source = ImageSequenceSource(sources, fps=capture_fps, recursive=True)
+        if not self.source.files:
+            raise ValueError(f"没有可回放的图片: {sources}")
+
+        # MQTT发送到进程内服务器，统计收到的分类消息和遥测数据
+        self.broker = FakeBroker()
+        self.category_messages = 0
+        subscriber = self.broker.client("soak_subscriber")
+        subscriber.on_message = self._on_category
+        subscriber.subscribe("garbage/category")
+        self.mqtt_client = self.broker.client("soak_app")
+        self.aggregator = TelemetryAggregator()
+        self.aggregator.attach(self.broker.client("soak_aggregator"))
+
+        self.speak_calls = 0
+        self.telemetry = TelemetryPublisher("soak", self.broker.client, interval=telemetry_interval)
+
+        if synthetic_latency_ms is not None:
+            def loader(directory):
+                return SyntheticModel(len(load_label_registry(directory).labels), synthetic_latency_ms)
+        else:
+            from paddlex import create_model
+            loader = create_model
+        self.model = PredictorHolder(model_dir, loader)
+
+        path = lambda name: os.path.join(work_dir, name)
+        self.image_store = HistoryImageStore(path("history_images"))
+        self.score_log = ScoreLog(path("score_log"))
+        self.history_compactor = HistoryCompactor(
+            HistoryArchive(path("history_archive")), RetentionPolicy.from_env(),
+            history_file=path("history.json"), interval=60)
+        self.pipeline = DetectionPipeline(
+            self.model, self.image_store, self.score_log, self.telemetry,
+            publish=self._publish, speak=self._speak,
+            history_file=path("history.json"),
+            temp_path=path("temp_frame.jpg"), output_path=path("output_frame.jpg"))
+
+    def _on_category(self, client, userdata, message):
+        self.category_messages += 1
+
+    def _publish(self, code):
+        self.mqtt_client.publish("garbage/category", code)
+
+    def _speak(self, text):
+        # 替代语音合成和播放
+        self.speak_calls += 1
+
+    def sample(self, elapsed, interval_latencies, interval_detections, interval_seconds):
+        return {
+            "elapsed_s": round(elapsed, 1),
+            "detections": interval_detections,
+            "throughput": round(interval_detections / max(interval_seconds, 1e-6), 2),
+            "latency_p50_ms": round(percentile(interval_latencies, 50), 1),
+            "latency_p99_ms": round(percentile(interval_latencies, 99), 1),
+            "rss_mb": round(read_rss_mb(), 1),
+            "fds": count_fds(),
+            "threads": threading.active_count(),
+            "disk_mb": round(directory_size_mb(self.work_dir), 2),
+            "write_queue": self.image_store.queue.qsize(),
+        }
+
+    def run(self, duration, report_interval=10, csv_file=None):
+        self.telemetry.start()
+        self.history_compactor.start()
+        samples = [self.sample(0, [], 0, 1)]
+        print(format_row(samples[0], header=True))
+        print(format_row(samples[0]))
+
+        start = time.perf_counter()
+        next_frame = next_detect = start
+        next_report = start + report_interval
+        latencies = []
+        detections = total = errors = 0
+        try:
+            while True:
+                now = time.perf_counter()
+                if now - start >= duration:
+                    if detections:
+                        samples.append(self.sample(now - start, latencies, detections,
+                                                   now - start - samples[-1]["elapsed_s"]))
+                        print(format_row(samples[-1]))
+                        total += detections
+                    break
+                ok, frame = self.source.read()
+                if ok and (self.detect_rate <= 0 or now >= next_detect):
+                    next_detect = max(next_detect + 1 / self.detect_rate, now) if self.detect_rate > 0 else now
+                    begin = time.perf_counter()
+                    try:
+                        detections += len(self.pipeline.process(frame))
+                    except Exception as e:
+                        errors += 1
+                        self.telemetry.record_error("detect")
+                        print(f"识别过程出错: {str(e)}")
+                    latencies.append((time.perf_counter() - begin) * 1000)
+
+                now = time.perf_counter()
+                if now >= next_report:
+                    samples.append(self.sample(now - start, latencies, detections, report_interval))
+                    print(format_row(samples[-1]))
+                    total += detections
+                    latencies, detections = [], 0
+                    next_report += report_interval
+
+                # 按采集帧率读取下一帧
+                next_frame += 1 / self.capture_fps
+                delay = next_frame - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_frame = time.perf_counter()
+        finally:
+            self.history_compactor.stop()
+            self.telemetry.stop()
+            self.image_store.close()
+            self.score_log.close()
+            self.source.release()
+
+        elapsed = time.perf_counter() - start
+        # 关闭后台任务后的文件句柄和线程数，用于检查是否有泄漏
+        self.closed = {"fds": count_fds(), "threads": threading.active_count()}
+        if csv_file:
+            with open(csv_file, "w", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=list(samples[0]))
+                writer.writeheader()
+                writer.writerows(samples)
+        return self.summarize(samples, total, errors, elapsed)
+
+    def summarize(self, samples, total, errors, elapsed):
+        # 第一行是启动时的基线，趋势只用运行期间的采样
+        running = [s for s in samples[1:] if s["detections"]] or samples[1:]
+        trend = lambda key: slope_per_hour([(s["elapsed_s"], s[key]) for s in running])
+        fleet = self.aggregator.fleet_summary(minutes=None)
+        return {
+            "duration_s": round(elapsed, 1),
+            "detections": total,
+            "errors": errors,
+            "throughput": round(total / elapsed, 2) if elapsed else 0.0,
+            "latency_p50_first_ms": running[0]["latency_p50_ms"] if running else 0.0,
+            "latency_p50_last_ms": running[-1]["latency_p50_ms"] if running else 0.0,
+            "latency_drift_ms_per_hour": round(trend("latency_p50_ms"), 1),
+            "rss_start_mb": samples[0]["rss_mb"],
+            "rss_end_mb": samples[-1]["rss_mb"],
+            "rss_growth_mb_per_hour": round(trend("rss_mb"), 1),
+            "fds_start": samples[0]["fds"],
+            "fds_end": samples[-1]["fds"],
+            "fds_after_close": self.closed["fds"],
+            "threads_start": samples[0]["threads"],
+            "threads_end": samples[-1]["threads"],
+            "threads_after_close": self.closed["threads"],
+            "disk_mb": samples[-1]["disk_mb"],
+            "disk_growth_mb_per_hour": round(trend("disk_mb"), 1),
+            "mqtt_messages": self.category_messages,
+            "voice_prompts": self.speak_calls,
+            "telemetry_detections": fleet["total"],
+            "inference_p99_ms": (metrics.snapshot()["timings"].get("inference_ms") or {}).get("p99"),
+        }
+
+
+COLUMNS = ["elapsed_s", "detections", "throughput", "latency_p50_ms", "latency_p99_ms",
+           "rss_mb", "fds", "threads", "disk_mb", "write_queue"]
+
+
+def format_row(sample, header=False):
+    if header:
+        return "  ".join(f"{name:>14}" for name in COLUMNS)
+    return "  ".join(f"{sample[name]:>14}" for name in COLUMNS)
+
+
+if __name__ == "__main__":
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+
+    parser = argparse.ArgumentParser(description="垃圾分类处理流程压力测试")
+    parser.add_argument("--duration", type=float, default=600, help="运行时长（秒）")
+    parser.add_argument("--capture-fps", type=float, default=15, help="帧源回放帧率")
+    parser.add_argument("--detect-rate", type=float, default=2, help="每秒识别次数，0表示尽可能快")
+    parser.add_argument("--report-interval", type=float, default=10, help="采样间隔（秒）")
+    parser.add_argument("--source", action="append",
+                        help="回放的图片目录，可多次指定（默认img/和history_images/）")
+    parser.add_argument("--model-dir", default=os.path.join(base_dir, "inference"))
+    parser.add_argument("--synthetic-latency-ms", type=float,
+                        help="使用固定耗时的模拟模型代替真实模型")
+    parser.add_argument("--work-dir", help="历史数据目录（默认临时目录，结束后删除）")
+    parser.add_argument("--csv", help="采样数据保存为CSV文件")
+    args = parser.parse_args()
+
+    sources = args.source or [os.path.join(base_dir, "img"), os.path.join(base_dir, "history_images")]
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="garbage_soak_")
+    try:
+        test = SoakTest(sources, work_dir, args.model_dir, args.capture_fps, args.detect_rate,
+                        args.synthetic_latency_ms)
+        summary = test.run(args.duration, args.report_interval, args.csv)
+        print("\n测试结果:")
+        for key, value in summary.items():
+            print(f"  {key}: {value}")
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
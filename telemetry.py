@@ -0,0 +1,264 @@
+import json
+import math
+import threading
+import time
+import uuid
+from collections import deque
+
+
+TELEMETRY_TOPIC = "garbage/telemetry"
+
+# 识别耗时直方图：第i个桶的上界为 HISTOGRAM_BASE**i 毫秒，各设备的直方图可以直接相加合并
+HISTOGRAM_BASE = 1.25
+HISTOGRAM_BUCKETS = 64
+
+# paho.mqtt.client.MQTT_ERR_NO_CONN：连接断开时消息已进入paho自身的发送队列
+MQTT_ERR_NO_CONN = 4
+
+
+def histogram_bucket(latency_ms):
+    if latency_ms <= 1:
+        return 0
+    return min(HISTOGRAM_BUCKETS - 1, math.ceil(math.log(latency_ms, HISTOGRAM_BASE)))
+
+
+def histogram_percentiles(histogram, quantiles=(50, 90, 99)):
+    """由稀疏直方图{桶序号: 次数}估算分位数（取桶上界，毫秒）"""
+    total = sum(histogram.values())
+    if not total:
+        return [None for _ in quantiles]
+    buckets = sorted(histogram.items())
+    result = []
+    for q in quantiles:
+        target = q / 100 * total
+        seen = 0
+        for bucket, count in buckets:
+            seen += count
+            if seen >= target:
+                result.append(round(HISTOGRAM_BASE ** bucket, 1))
+                break
+    return result
+
+
+class TelemetryPublisher:
+    """周期性发布本机遥测数据
+
+    每个周期的分类计数、识别耗时直方图和分位数、错误计数汇总为一个批次，
+    以紧凑JSON发布到 garbage/telemetry/<设备ID>。未连接时批次保留在
+    有上限的队列中，连接后与新批次一起发送；每个批次带本进程内递增的序号，
+    消息带进程启动时生成的会话ID，汇总服务据此丢弃重复的批次，
+    不依赖终端时钟。
+    """
+
+    def __init__(self, device_id, client_factory, interval=60, max_pending=60,
+                 topic_prefix=TELEMETRY_TOPIC):
+        self.device_id = device_id
+        self.client_factory = client_factory
+        self.interval = interval
+        self.topic = f"{topic_prefix}/{device_id}"
+        self.pending = deque(maxlen=max_pending)
+        self.lock = threading.Lock()
+        self.client = None
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.session = uuid.uuid4().hex[:16]
+        self.sequence = 0
+        self._reset_window()
+
+    def _reset_window(self, now=None):
+        self.window_start = now or time.time()
+        self.counts = {}
+        self.histogram = {}
+        self.errors = {}
+
+    def record_detection(self, category, latency_ms):
+        bucket = histogram_bucket(latency_ms)
+        with self.lock:
+            self.counts[category] = self.counts.get(category, 0) + 1
+            self.histogram[bucket] = self.histogram.get(bucket, 0) + 1
+
+    def record_error(self, kind):
+        with self.lock:
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.stop_event.set()
+        self.thread.join()
+        self.flush()
+        with self.lock:
+            client, self.client = self.client, None
+        _close_client(client)
+
+    def reconfigure(self, client_factory):
+        """更换服务器设置后，下次发布时重新创建连接"""
+        with self.lock:
+            old, self.client = self.client, None
+            self.client_factory = client_factory
+        _close_client(old)
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        """结束当前周期，发布所有待发送批次，返回是否发送成功"""
+        with self.lock:
+            now = time.time()
+            if self.counts or self.errors:
+                self.sequence += 1
+                batch = {
+                    "t": int(self.window_start),
+                    "n": self.sequence,
+                    "s": int(now - self.window_start),
+                    "c": self.counts,
+                    "h": {str(k): v for k, v in self.histogram.items()},
+                    "p": histogram_percentiles(self.histogram),
+                    "e": self.errors,
+                }
+                self.pending.append(batch)
+            self._reset_window(now)
+            if not self.pending:
+                return True
+            batches = list(self.pending)
+            try:
+                # 与reconfigure()互斥，不会用旧的服务器设置创建连接
+                if self.client is None:
+                    self.client = self.client_factory()
+            except Exception as e:
+                print(f"创建遥测连接失败: {str(e)}")
+                return False
+            client = self.client
+
+        payload = json.dumps({"v": 1, "d": self.device_id, "k": self.session, "b": batches},
+                             ensure_ascii=False, separators=(",", ":"))
+        try:
+            if not client.is_connected():
+                # 未连接时不交给paho，避免批次在paho的发送队列中无限堆积
+                return False
+            info = client.publish(self.topic, payload, qos=1)
+            # NO_CONN表示刚断开，消息已进入paho的队列，重连后会发送，不再重复发送
+            if info.rc not in (0, MQTT_ERR_NO_CONN):
+                return False
+        except Exception as e:
+            print(f"发布遥测数据失败: {str(e)}")
+            return False
+
+        with self.lock:
+            for _ in batches:
+                if self.pending:
+                    self.pending.popleft()
+        return True
+
+
+def _close_client(client):
+    """先断开连接再停止网络线程，让DISCONNECT报文能够发出"""
+    if client is None:
+        return
+    try:
+        client.disconnect()
+        client.loop_stop()
+    except Exception:
+        pass
+
+
+def paho_client_factory(broker, port, client_id):
+    """返回创建paho客户端的函数，客户端在后台线程中连接并自动重连"""
+    def factory():
+        import paho.mqtt.client as mqtt
+
+        client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id)
+        # 限制paho内部的待发送消息数，未确认的消息不会无限增长
+        client.max_queued_messages_set(10)
+        client.connect_async(broker, port, 30)
+        client.loop_start()
+        return client
+    return factory
+
+
+def topic_matches(pattern, topic):
+    """MQTT主题通配符匹配（支持+和#）"""
+    pattern_parts = pattern.split("/")
+    topic_parts = topic.split("/")
+    for i, part in enumerate(pattern_parts):
+        if part == "#":
+            return True
+        if i >= len(topic_parts) or (part != "+" and part != topic_parts[i]):
+            return False
+    return len(pattern_parts) == len(topic_parts)
+
+
+class FakeMessage:
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload if isinstance(payload, bytes) else str(payload).encode("utf-8")
+
+
+class FakePublishResult:
+    rc = 0
+
+
+class FakeClient:
+    """进程内的MQTT客户端替身，接口与paho客户端常用部分一致"""
+
+    def __init__(self, broker, client_id=""):
+        self.broker = broker
+        self.client_id = client_id
+        self.on_message = None
+
+    def connect(self, *args, **kwargs):
+        return 0
+
+    def is_connected(self):
+        return True
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self.broker.publish(topic, payload)
+        return FakePublishResult()
+
+    def subscribe(self, topic, qos=0):
+        self.broker.subscribe(topic, self)
+        return 0, 0
+
+    def loop_start(self):
+        pass
+
+    def loop_stop(self):
+        pass
+
+    def disconnect(self):
+        self.broker.unsubscribe(self)
+
+
+class FakeBroker:
+    """进程内的MQTT服务器替身，用于测试和压力测试"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = []
+        self.published = 0
+
+    def client(self, client_id=""):
+        return FakeClient(self, client_id)
+
+    def subscribe(self, pattern, client):
+        with self.lock:
+            self.subscriptions.append((pattern, client))
+
+    def unsubscribe(self, client):
+        with self.lock:
+            self.subscriptions = [(p, c) for p, c in self.subscriptions if c is not client]
+
+    def publish(self, topic, payload):
+        with self.lock:
+            self.published += 1
+            targets = [c for p, c in self.subscriptions if topic_matches(p, topic)]
+        message = FakeMessage(topic, payload)
+        for client in targets:
+            if client.on_message is not None:
+                client.on_message(client, None, message)
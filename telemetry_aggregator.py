@@ -0,0 +1,217 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from telemetry import TELEMETRY_TOPIC, histogram_percentiles
+
+
+class Rollup:
+    """某个时间桶内的汇总：分类计数、耗时直方图、错误计数"""
+
+    __slots__ = ("counts", "histogram", "errors")
+
+    def __init__(self):
+        self.counts = {}
+        self.histogram = {}
+        self.errors = {}
+
+    def merge(self, counts, histogram, errors):
+        for key, value in counts.items():
+            self.counts[key] = self.counts.get(key, 0) + value
+        for key, value in histogram.items():
+            key = int(key)
+            self.histogram[key] = self.histogram.get(key, 0) + value
+        for key, value in errors.items():
+            self.errors[key] = self.errors.get(key, 0) + value
+
+    def summary(self):
+        p50, p90, p99 = histogram_percentiles(self.histogram)
+        return {
+            "counts": dict(self.counts),
+            "total": sum(self.counts.values()),
+            "latency_ms": {"p50": p50, "p90": p90, "p99": p99},
+            "errors": dict(self.errors),
+        }
+
+
+class RollupSeries:
+    """固定数量的时间桶，按桶起始时间排序，超出数量时丢弃最早的桶"""
+
+    __slots__ = ("width", "capacity", "buckets")
+
+    def __init__(self, width, capacity):
+        self.width = width
+        self.capacity = capacity
+        self.buckets = OrderedDict()
+
+    def add(self, timestamp, counts, histogram, errors):
+        start = int(timestamp // self.width * self.width)
+        if self.buckets and start < next(iter(self.buckets)) and len(self.buckets) >= self.capacity:
+            return  # 比保留范围还早的数据直接丢弃
+        rollup = self.buckets.get(start)
+        if rollup is None:
+            rollup = self.buckets[start] = Rollup()
+            if len(self.buckets) > 1 and start < next(reversed(self.buckets)):
+                self.buckets = OrderedDict(sorted(self.buckets.items()))
+            while len(self.buckets) > self.capacity:
+                self.buckets.popitem(last=False)
+        rollup.merge(counts, histogram, errors)
+
+    def total(self, since=None):
+        """合并since之后所有桶"""
+        result = Rollup()
+        for start, rollup in self.buckets.items():
+            if since is None or start >= since:
+                result.merge(rollup.counts, rollup.histogram, rollup.errors)
+        return result
+
+
+class DeviceState:
+    __slots__ = ("minutes", "hours", "last_seen", "messages", "sessions")
+
+    # 每台设备记录的最近会话数，重启前后的消息交错到达时仍能去重
+    MAX_SESSIONS = 8
+
+    def __init__(self, minute_buckets, hour_buckets):
+        self.minutes = RollupSeries(60, minute_buckets)
+        self.hours = RollupSeries(3600, hour_buckets)
+        self.last_seen = 0.0
+        self.messages = 0
+        # 会话ID -> 已汇总的最后一个批次序号，用于丢弃重发的批次
+        self.sessions = OrderedDict()
+
+    def accept(self, session, sequence):
+        """批次序号大于该会话已汇总的序号时返回True并记录"""
+        last = self.sessions.get(session)
+        if last is not None and sequence <= last:
+            return False
+        self.sessions[session] = sequence
+        self.sessions.move_to_end(session)
+        while len(self.sessions) > self.MAX_SESSIONS:
+            self.sessions.popitem(last=False)
+        return True
+
+
+class TelemetryAggregator:
+    """汇总各设备上报的遥测数据
+
+    每台设备保留最近若干分钟桶和小时桶的增量汇总，全体设备另有一份同样的汇总；
+    设备数超过上限时淘汰最久未上报的设备，内存占用有上界。
+    QoS 1可能重复投递，终端也会重发未确认的批次，按(会话ID, 序号)丢弃已汇总过的批次。
+    handle在MQTT网络线程中调用，与查询方法共用一把锁。
+    """
+
+    def __init__(self, minute_buckets=60, hour_buckets=48, max_devices=10000,
+                 topic_prefix=TELEMETRY_TOPIC):
+        self.minute_buckets = minute_buckets
+        self.hour_buckets = hour_buckets
+        self.max_devices = max_devices
+        self.topic_prefix = topic_prefix
+        self.devices = OrderedDict()
+        self.fleet = DeviceState(minute_buckets, hour_buckets)
+        self.invalid_messages = 0
+        self.duplicate_batches = 0
+        self.lock = threading.Lock()
+
+    def attach(self, client):
+        """订阅所有设备的遥测主题"""
+        client.on_message = lambda client, userdata, message: self.handle(message.topic, message.payload)
+        client.subscribe(f"{self.topic_prefix}/+", qos=1)
+
+    def handle(self, topic, payload):
+        try:
+            message = json.loads(payload)
+            device_id = message["d"]
+            session = str(message.get("k", ""))
+            batches = message["b"]
+        except (ValueError, KeyError, TypeError):
+            self.invalid_messages += 1
+            return
+
+        with self.lock:
+            state = self.devices.get(device_id)
+            if state is None:
+                state = self.devices[device_id] = DeviceState(self.minute_buckets, self.hour_buckets)
+                while len(self.devices) > self.max_devices:
+                    self.devices.popitem(last=False)
+            else:
+                self.devices.move_to_end(device_id)
+            state.last_seen = time.time()
+            state.messages += 1
+
+            for batch in batches:
+                try:
+                    timestamp = int(batch["t"])
+                    sequence = int(batch["n"])
+                    args = (batch.get("c", {}), batch.get("h", {}), batch.get("e", {}))
+                except (KeyError, TypeError, ValueError):
+                    self.invalid_messages += 1
+                    continue
+                # 终端在同一会话内按序号顺序发送批次，不大于已汇总的序号即为重复；
+                # 只比较序号，终端时钟回拨不会把新批次误判为重复
+                if not state.accept(session, sequence):
+                    self.duplicate_batches += 1
+                    continue
+                for target in (state, self.fleet):
+                    target.minutes.add(timestamp, *args)
+                    target.hours.add(timestamp, *args)
+
+    def device_summary(self, device_id, minutes=60):
+        """最近minutes分钟的汇总，minutes为None时汇总保留的所有分钟桶"""
+        with self.lock:
+            state = self.devices.get(device_id)
+            if state is None:
+                return None
+            total = state.minutes.total(_since(minutes))
+            last_seen = state.last_seen
+        summary = total.summary()
+        summary["last_seen"] = last_seen
+        return summary
+
+    def fleet_summary(self, minutes=60):
+        with self.lock:
+            total = self.fleet.minutes.total(_since(minutes))
+            devices = len(self.devices)
+        summary = total.summary()
+        summary["devices"] = devices
+        return summary
+
+    def hourly(self, device_id=None):
+        """按小时的汇总列表[(小时起始时间戳, 汇总)]"""
+        with self.lock:
+            state = self.fleet if device_id is None else self.devices.get(device_id)
+            if state is None:
+                return []
+            return [(start, rollup.summary()) for start, rollup in state.hours.buckets.items()]
+
+
+def _since(minutes):
+    if minutes is None:
+        return None
+    # 按桶起始时间对齐，包含当前正在累计的桶
+    return (time.time() - minutes * 60) // 60 * 60
+
+
+if __name__ == "__main__":
+    import argparse
+    import paho.mqtt.client as mqtt
+
+    parser = argparse.ArgumentParser(description="垃圾分类终端遥测汇总服务")
+    parser.add_argument("--broker", default="localhost")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--report-interval", type=int, default=60)
+    args = parser.parse_args()
+
+    aggregator = TelemetryAggregator()
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id="garbage_telemetry_aggregator")
+    client.on_connect = lambda client, userdata, flags, reason, properties: aggregator.attach(client)
+    client.connect(args.broker, args.port, 30)
+    client.loop_start()
+    try:
+        while True:
+            time.sleep(args.report_interval)
+            print(json.dumps(aggregator.fleet_summary(), ensure_ascii=False))
+    except KeyboardInterrupt:
+        client.disconnect()
+        client.loop_stop()